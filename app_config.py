@@ -1,4 +1,7 @@
+import atexit
+import json
 import streamlit as st
+from prompter import Prompter, AsyncRunner
 
 # ==============================================
 # Sub-functions for modularity
@@ -54,6 +57,8 @@ def handle_custom_endpoint_ui(key_suffix:str=""):
     custom_base_url = st.text_input("Enter base URL:", key="manual_custom_base_url"+key_suffix)
     st.session_state["base_url"] = custom_base_url if custom_base_url else ""
     st.session_state["AVAILABLE_MODELS"] = []
+    st.session_state["RATE_LIMITS"] = None
+    st.session_state["CACHE_CONTROL"] = False
     
     # Separator for better UI organization
     st.markdown("---")
@@ -112,6 +117,8 @@ def handle_provider_configuration(services_dict:dict, checkbox_keys:list=[], key
             st.session_state["base_url"] = services_dict[selected_checkbox]["base_url"]
             st.session_state["AVAILABLE_MODELS"] = services_dict[selected_checkbox]["available_models"]
             st.session_state["HELP_MESSAGE"] = services_dict[selected_checkbox]["help_message"]
+            st.session_state["RATE_LIMITS"] = services_dict[selected_checkbox].get("rate_limits")
+            st.session_state["CACHE_CONTROL"] = services_dict[selected_checkbox].get("cache_control", False)
 
     return token_name
 
@@ -141,6 +148,8 @@ def log_api(prompter, api_key:str=None):
             if api_key:
                 prompter._set_token(api_key)
                 prompter._set_base_url(st.session_state["base_url"])
+                prompter._set_rate_limits(st.session_state.get("RATE_LIMITS"))
+                prompter._set_cache_control(st.session_state.get("CACHE_CONTROL", False))
                 st.session_state["log_status"] = True
             else:
                 st.warning('Please enter your API token.', icon='⚠️')
@@ -166,6 +175,49 @@ def set_generation_parameters(prompter, default_gen_args, key_suffix:str=""):
         prompter._update_generation_arg(k, selected_val)
 
 
+# ==============================================
+# Resources shared across reruns and browser sessions
+
+@st.cache_resource
+def get_async_runner():
+    """
+    Event loop shared by all sessions of the server process, keeping async connection pools open between reruns.
+    """
+    runner = AsyncRunner()
+    atexit.register(runner.close)
+    return runner
+
+def session_prompter(config, key:str="prompter"):
+    """
+    Returns this session's Prompter for the configuration collected in `config` (a Prompter
+    filled by the sidebar widgets).
+
+    The session's Prompter is kept across reruns as long as the configuration doesn't change,
+    so templates and options set on it persist. Per-session settings (template, layout, cache)
+    stay on it, while the state worth sharing between sessions (connection pools, rate
+    limiters, latency history) is held process-wide, keyed by endpoint and token.
+    """
+    resource_key = (
+        config.base_url,
+        config.token,
+        config.model_name,
+        json.dumps(config.generation_args, sort_keys=True),
+        json.dumps(config.rate_limits, sort_keys=True),
+        config.cache_control,
+    )
+    cached = st.session_state.get(key)
+    if cached is None or cached[0] != resource_key:
+        prompter = Prompter(base_url=config.base_url)
+        prompter._set_token(config.token)
+        prompter._set_model(config.model_name)
+        prompter._set_generation_args(dict(config.generation_args))
+        prompter._set_rate_limits(config.rate_limits)
+        prompter._set_cache_control(config.cache_control)
+        cached = (resource_key, prompter)
+        st.session_state[key] = cached
+    return cached[1]
+
+
 # ==============================================
 # Main function
 
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from prompter import Prompter, APIError, get_async_session, is_retryable, retry_delay, parse_retry_after
+from concurrency import CancelToken
+
+# Limits of one batch on OpenAI-compatible providers
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+# Path of the chat completions endpoint, as referenced by the batch input file
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Seconds between two status checks of a batch
+DEFAULT_POLL_INTERVAL = 30.0
+# Seconds to wait for a cancelled batch to hand back its partial results
+CANCEL_GRACE = 60.0
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Retries of the file / batch management calls
+MAX_CALL_RETRIES = 3
+
+def api_root(base_url: str):
+    """
+    Root of the OpenAI-compatible API of a chat completions URL (e.g. "https://host/v1").
+    """
+    suffix = "/chat/completions"
+    base_url = base_url.rstrip("/")
+    return base_url[:-len(suffix)] if base_url.endswith(suffix) else base_url
+
+def make_batch_files(
+    prompter: Prompter,
+    requests,  # Iterable of (custom_id, prompt_dicts)
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_bytes: int = MAX_BATCH_BYTES,
+):
+    """
+    Serializes chat completion requests to JSONL batch input files, split to fit the batch limits.
+
+    Yields:
+        bytes: The content of each input file.
+    """
+    lines, size = [], 0
+    for custom_id, prompt_dicts in requests:
+        line = json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": prompter._payload(prompt_dicts),
+        }).encode("utf-8") + b"\n"
+        if lines and (len(lines) >= max_requests or size + len(line) > max_bytes):
+            yield b"".join(lines)
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line)
+    if lines:
+        yield b"".join(lines)
+
+async def _call(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    headers: dict,
+    **kwargs,  # Forwarded to `session.request`
+):
+    """
+    Sends a file / batch management request and returns its JSON body, retrying transient errors.
+    """
+    for retry in range(MAX_CALL_RETRIES + 1):
+        try:
+            async with session.request(method, url, headers=headers, **kwargs) as response:
+                content = await response.read()
+                if response.status >= 400:
+                    raise APIError(
+                        f"HTTP {response.status}: {content[:200].decode('utf-8', 'replace')}",
+                        status_code=response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                    )
+                return json.loads(content)
+        except Exception as e:
+            if retry < MAX_CALL_RETRIES and is_retryable(e):
+                await asyncio.sleep(retry_delay(e, retry))
+            else:
+                raise
+
+async def submit_batch(
+    prompter: Prompter,
+    content: bytes,  # JSONL input file
+):
+    """
+    Uploads a batch input file and creates the batch.
+
+    Returns:
+        dict: The batch object.
+    """
+    root = api_root(prompter.base_url)
+    session = get_async_session(prompter.base_url)
+    form = aiohttp.FormData()
+    form.add_field("purpose", "batch")
+    form.add_field("file", content, filename="batch_input.jsonl", content_type="application/jsonl")
+    uploaded = await _call(session, "POST", f"{root}/files", prompter._headers(), data=form)
+    return await _call(session, "POST", f"{root}/batches", prompter._headers(), json={
+        "input_file_id": uploaded["id"],
+        "endpoint": BATCH_ENDPOINT,
+        "completion_window": COMPLETION_WINDOW,
+    })
+
+async def wait_for_batch(
+    prompter: Prompter,
+    batch: dict,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    cancel_token: CancelToken = None,
+    progress_callback=None,  # Called with the batch object after every status check
+):
+    """
+    Polls a batch until it ends. When the token is cancelled, the batch is cancelled on the
+    provider's side and polled a while longer for its partial results.
+
+    Returns:
+        dict: The last batch object.
+    """
+    root = api_root(prompter.base_url)
+    session = get_async_session(prompter.base_url)
+    cancelled_at = None
+    while batch["status"] not in TERMINAL_STATUSES:
+        if cancel_token is not None and cancel_token.cancelled and cancelled_at is None:
+            batch = await _call(session, "POST", f"{root}/batches/{batch['id']}/cancel", prompter._headers())
+            cancelled_at = time.monotonic()
+            continue
+        if cancelled_at is not None and time.monotonic() - cancelled_at > CANCEL_GRACE:
+            break
+        interval = poll_interval if cancelled_at is None else min(poll_interval, 5.0)
+        if cancel_token is not None and cancelled_at is None:
+            # Wake up early on cancellation
+            try:
+                await asyncio.wait_for(cancel_token.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(interval)
+        batch = await _call(session, "GET", f"{root}/batches/{batch['id']}", prompter._headers())
+        if progress_callback:
+            progress_callback(batch)
+    return batch
+
+async def read_batch_file(
+    prompter: Prompter,
+    file_id: str,
+):
+    """
+    Streams the lines of a batch output or error file.
+
+    Yields:
+        dict: Each decoded line.
+    """
+    root = api_root(prompter.base_url)
+    session = get_async_session(prompter.base_url)
+    async with session.get(f"{root}/files/{file_id}/content", headers=prompter._headers()) as response:
+        if response.status >= 400:
+            raise APIError(f"HTTP {response.status} while downloading {file_id}", status_code=response.status)
+        async for line in response.content:
+            if line.strip():
+                yield json.loads(line)
+
+def parse_batch_line(line: dict):
+    """
+    Extracts the response message of a batch output line.
+
+    Returns:
+        tuple: (content, error message). One of them is None.
+    """
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code", 200) >= 400 or "choices" not in body:
+        error = line.get("error") or body.get("error", body)
+        return None, f"Error: HTTP {response.get('status_code')}: {error}"
+    return body["choices"][0]["message"]["content"], None
+
+async def async_batch_generate(
+    prompter: Prompter,
+    prompts,  # Prompt strings, or rendered prompts when `rendered` is True
+    rendered: bool = False,
+    error_callback=None,  # Called with (index, error message) for failed prompts
+    result_callback=None,  # Called with (index, response) for each response
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    cancel_token: CancelToken = None,
+    progress_callback=None,  # Called with the batch objects after every status check
+):
+    """
+    Completes prompts through the provider's offline batch API (`/files` + `/batches`), which
+    trades latency (up to the 24h completion window) for throughput and cost on very large jobs.
+
+    Prompts are serialized to JSONL input files within the batch limits, every file is uploaded
+    and submitted at once, the batches are polled, and their output is streamed back to the
+    callbacks with the prompt indices. Cached responses are used without submission and, at
+    deterministic settings, identical prompts are submitted once.
+
+    Returns:
+        list: The responses in input order. Failed prompts, and prompts not completed before a
+            stop, are left empty.
+    """
+    prompts = list(prompts)
+    results = [""] * len(prompts)
+
+    def deliver(indices, content):
+        for i in indices:
+            results[i] = content
+            if result_callback:
+                result_callback(i, content)
+
+    # One request per distinct prompt at deterministic settings, keyed by its first index
+    if prompter._is_deterministic():
+        groups = prompter._group_prompts(prompts, rendered, error_callback=error_callback)
+        work = [(indices, prompt) for prompt, indices in groups.items()]
+        rendered = True
+    else:
+        work = [([i], prompt) for i, prompt in enumerate(prompts)]
+    pending = {}
+    requests = []
+    for indices, prompt in work:
+        try:
+            prompt_dicts = prompter.make_messages(prompt, rendered=rendered)
+        except Exception as e:
+            # A malformed row only fails itself
+            if error_callback:
+                for i in indices:
+                    error_callback(i, f"Error: {str(e)}")
+            continue
+        cache_key = prompter._cache_key(prompt_dicts)
+        cached = await asyncio.to_thread(prompter.cache.get, cache_key) if cache_key is not None else None
+        if cached is not None:
+            deliver(indices, cached)
+            continue
+        custom_id = f"request-{indices[0]}"
+        pending[custom_id] = (indices, cache_key)
+        requests.append((custom_id, prompt_dicts))
+    if not requests:
+        return results
+
+    batches = [await submit_batch(prompter, content) for content in make_batch_files(prompter, requests)]
+    statuses = {batch["id"]: batch for batch in batches}
+
+    def on_progress(batch):
+        statuses[batch["id"]] = batch
+        if progress_callback:
+            progress_callback(list(statuses.values()))
+
+    async def collect(batch):
+        batch = await wait_for_batch(prompter, batch, poll_interval, cancel_token, on_progress)
+        for file_key in ("output_file_id", "error_file_id"):
+            if not batch.get(file_key):
+                continue
+            async for line in read_batch_file(prompter, batch[file_key]):
+                if line.get("custom_id") not in pending:
+                    continue
+                indices, cache_key = pending.pop(line["custom_id"])
+                content, error = parse_batch_line(line)
+                if error is not None:
+                    if error_callback:
+                        for i in indices:
+                            error_callback(i, error)
+                    continue
+                if cache_key is not None:
+                    await asyncio.to_thread(prompter.cache.set, cache_key, content)
+                deliver(indices, content)
+        return batch
+
+    batches = await asyncio.gather(*[collect(batch) for batch in batches])
+    # Requests left without an answer (failed, expired or cancelled batches)
+    if error_callback and pending:
+        status = ", ".join(sorted({batch["status"] for batch in batches}))
+        for indices, _ in pending.values():
+            for i in indices:
+                error_callback(i, f"Error: no result in batch ({status})")
+    return results
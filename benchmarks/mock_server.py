@@ -0,0 +1,209 @@
+"""
+Local OpenAI-compatible `/v1/chat/completions` server for load tests.
+
+Responses come after a random delay drawn from a log-normal distribution, and can be made to
+fail with 429 / 500 errors at configurable rates. Streaming requests (`"stream": true`) are
+answered with server-sent events. The offline batch API (`/v1/files`, `/v1/batches`) is served
+too: batches complete after `--batch-duration` seconds, their output lines in random order.
+
+Usage:
+    python benchmarks/mock_server.py --port 8765 --latency-median 0.2 --latency-sigma 0.5 --rate-429 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+from aiohttp import web
+
+def make_app(
+    latency_median: float = 0.2,  # Median response delay, in seconds
+    latency_sigma: float = 0.5,  # Spread of the log-normal delay (0 for a constant delay)
+    rate_429: float = 0.0,  # Share of requests answered with 429 Too Many Requests
+    rate_500: float = 0.0,  # Share of requests answered with 500 Internal Server Error
+    retry_after: float = 1.0,  # Retry-After sent with 429 responses, in seconds
+    tokens_per_s: float = 200.0,  # Streaming speed
+    completion_words: int = 20,  # Words in each completion
+    echo: bool = False,  # Start each completion with the last message, to check responses map to prompts
+    batch_duration: float = 2.0,  # Time for a batch to complete, in seconds
+    tokens: list = None,  # Bearer tokens accepted by the chat endpoint, None to accept any
+):
+    """
+    Builds the aiohttp application serving the mock endpoint.
+    """
+    stats = {"requests": 0, "errors": 0, "batches": 0}
+    files = {}  # File id -> content
+    batches = {}  # Batch id -> batch object
+
+    def delay():
+        if latency_sigma <= 0:
+            return latency_median
+        return random.lognormvariate(math.log(latency_median), latency_sigma)
+
+    async def chat_completions(request):
+        body = await request.json()
+        stats["requests"] += 1
+        if tokens is not None and request.headers.get("Authorization") not in [f"Bearer {t}" for t in tokens]:
+            stats["errors"] += 1
+            return web.json_response({"error": "unauthorized"}, status=401)
+        draw = random.random()
+        if draw < rate_429:
+            stats["errors"] += 1
+            return web.json_response(
+                {"error": "rate limited"}, status=429, headers={"Retry-After": f"{retry_after:g}"}
+            )
+        if draw < rate_429 + rate_500:
+            stats["errors"] += 1
+            await asyncio.sleep(delay())
+            return web.json_response({"error": "internal error"}, status=500)
+
+        prompt = str(body["messages"][-1]["content"])
+        words = ([prompt] if echo else []) + [f"w{i}" for i in range(completion_words)]
+        prompt_tokens = len(prompt) // 4 + 1
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            await asyncio.sleep(delay())  # Time to first token
+            for word in words:
+                chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await asyncio.sleep(1 / tokens_per_s)
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        await asyncio.sleep(delay() + len(words) / tokens_per_s)
+        return web.json_response({
+            "id": f"mock-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)},
+        })
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    # =============================================
+    # Batch API
+
+    def completion_line(line: dict):
+        """
+        Output line of one batch request, failing at the configured error rates.
+        """
+        body = line["body"]
+        if random.random() < rate_429 + rate_500:
+            status, response_body = 500, {"error": "internal error"}
+        else:
+            prompt = str(body["messages"][-1]["content"])
+            words = ([prompt] if echo else []) + [f"w{i}" for i in range(completion_words)]
+            status, response_body = 200, {
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            }
+        return {"custom_id": line["custom_id"], "response": {"status_code": status, "body": response_body}, "error": None}
+
+    async def run_batch(batch_id: str):
+        batch = batches[batch_id]
+        lines = [json.loads(line) for line in files[batch["input_file_id"]].splitlines() if line.strip()]
+        batch["status"] = "in_progress"
+        batch["request_counts"]["total"] = len(lines)
+        await asyncio.sleep(batch_duration)
+        if batch["status"] != "in_progress":
+            return
+        random.shuffle(lines)
+        outputs = [completion_line(line) for line in lines]
+        output_id = f"file-{len(files)}"
+        files[output_id] = "".join(json.dumps(output) + "\n" for output in outputs).encode()
+        batch["output_file_id"] = output_id
+        batch["request_counts"]["completed"] = sum(1 for output in outputs if output["response"]["status_code"] == 200)
+        batch["request_counts"]["failed"] = len(outputs) - batch["request_counts"]["completed"]
+        batch["status"] = "completed"
+
+    async def upload_file(request):
+        form = await request.post()
+        file_id = f"file-{len(files)}"
+        files[file_id] = form["file"].file.read()
+        return web.json_response({"id": file_id, "object": "file", "purpose": form.get("purpose")})
+
+    async def file_content(request):
+        content = files.get(request.match_info["file_id"])
+        if content is None:
+            return web.json_response({"error": "file not found"}, status=404)
+        return web.Response(body=content, content_type="application/jsonl")
+
+    async def create_batch(request):
+        body = await request.json()
+        if body.get("input_file_id") not in files:
+            return web.json_response({"error": "input file not found"}, status=400)
+        stats["batches"] += 1
+        batch_id = f"batch-{len(batches)}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"],
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        asyncio.ensure_future(run_batch(batch_id))
+        return web.json_response(batches[batch_id])
+
+    async def get_batch(request):
+        batch = batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": "batch not found"}, status=404)
+        return web.json_response(batch)
+
+    async def cancel_batch(request):
+        batch = batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": "batch not found"}, status=404)
+        if batch["status"] not in ("completed", "failed", "expired"):
+            batch["status"] = "cancelled"
+        return web.json_response(batch)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/files", upload_file)
+    app.router.add_get("/v1/files/{file_id}/content", file_content)
+    app.router.add_post("/v1/batches", create_batch)
+    app.router.add_get("/v1/batches/{batch_id}", get_batch)
+    app.router.add_post("/v1/batches/{batch_id}/cancel", cancel_batch)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-median", type=float, default=0.2)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--completion-words", type=int, default=20)
+    parser.add_argument("--echo", action="store_true", help="Start completions with the last message.")
+    parser.add_argument("--batch-duration", type=float, default=2.0)
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    app = make_app(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        retry_after=args.retry_after,
+        tokens_per_s=args.tokens_per_s,
+        completion_words=args.completion_words,
+        echo=args.echo,
+        batch_duration=args.batch_duration,
+    )
+    web.run_app(app, host=args.host, port=args.port, print=None)
@@ -0,0 +1,225 @@
+"""
+Load-test benchmarks of the Prompter engine against the local mock server.
+
+Starts `mock_server.py` in a subprocess, then drives `Prompter.generate`, `generate_stream`,
+`async_generate_batch` and the chunked CSV pipeline through it. Each scenario runs in its own
+process, so that its peak memory isn't inherited from the previous ones. Reports requests/sec,
+latency percentiles and peak memory, saves the results as JSON in `benchmarks/results/` and
+compares them with the previous run so that regressions show up between versions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --requests 2000 --concurrency 64 --rate-429 0.02
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_FOLDER))
+
+import pandas as pd
+
+import metrics
+from prompter import Prompter
+from csv_pipeline import complete_csv
+
+RESULTS_FOLDER = os.path.join(BENCHMARKS_FOLDER, "results")
+SCENARIOS = ("generate_sequential", "generate_stream", "async_generate_batch", "csv_pipeline")
+
+_records = []  # Request records of the scenario being run
+metrics.add_metrics_hook(_records.append)
+
+def start_mock_server(port: int, args):
+    """
+    Launches the mock server in a subprocess and waits until it accepts connections.
+    """
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCHMARKS_FOLDER, "mock_server.py"),
+        "--port", str(port),
+        "--latency-median", str(args.latency_median),
+        "--latency-sigma", str(args.latency_sigma),
+        "--rate-429", str(args.rate_429),
+        "--rate-500", str(args.rate_500),
+        "--retry-after", str(args.retry_after),
+    ])
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Mock server did not start.")
+
+def peak_rss_mb():
+    # Peak of the whole process: meaningful because every scenario runs in a fresh one.
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def run_scenario(name: str, fn):
+    """
+    Runs one scenario and summarizes the requests it sent.
+    """
+    _records.clear()
+    start = time.monotonic()
+    fn()
+    duration = time.monotonic() - start
+    latencies = [r["latency"] for r in _records if r["status"].startswith("2")]
+    ttfts = [r["ttft"] for r in _records if r["ttft"] is not None]
+    result = {
+        "requests": len(_records),
+        "errors": len(_records) - len(latencies),
+        "duration_s": round(duration, 3),
+        "requests_per_s": round(len(latencies) / duration, 2) if duration else None,
+        "p50_s": metrics.percentile(latencies, 50),
+        "p95_s": metrics.percentile(latencies, 95),
+        "p99_s": metrics.percentile(latencies, 99),
+        "p50_ttft_s": metrics.percentile(ttfts, 50),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(f"{name:<24} " + " ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
+    return result
+
+def attempt(fn, *args):
+    """
+    Calls `fn`, counting failures through the metrics instead of aborting the scenario.
+    """
+    try:
+        result = fn(*args)
+        return list(result) if not isinstance(result, str) else result
+    except Exception:
+        return None
+
+def make_prompter(base_url: str):
+    prompter = Prompter(base_url=base_url)
+    prompter._set_token("mock")
+    prompter._set_model("mock-model")
+    # Sampling settings: no deduplication, every prompt is a request
+    prompter._set_generation_args({"temperature": 1.0, "max_tokens": 64})
+    return prompter
+
+def scenario_fn(name: str, prompter: Prompter, args, folder: str):
+    """
+    The function running one scenario.
+    """
+    if name == "generate_sequential":
+        return lambda: [attempt(prompter.generate, [{"role": "user", "content": f"prompt {i}"}]) for i in range(args.sequential_requests)]
+    if name == "generate_stream":
+        return lambda: [attempt(prompter.generate_stream, [{"role": "user", "content": f"prompt {i}"}]) for i in range(args.stream_requests)]
+    if name == "async_generate_batch":
+        return lambda: prompter.generate_batch([f"prompt {i}" for i in range(args.requests)], batch_size=args.concurrency)
+    input_path = os.path.join(folder, "input.csv")
+    pd.DataFrame({"text": [f"row {i}" for i in range(args.csv_rows)]}).to_csv(input_path, index=False)
+    return lambda: complete_csv(
+        prompters=[prompter],
+        input_file=input_path,
+        output_path=os.path.join(folder, "output.csv"),
+        text_column="text",
+        completion_columns=["completion"],
+        batch_size=args.concurrency,
+    )
+
+def run_scenario_process(name: str, argv: list):
+    """
+    Runs one scenario in a child process (see `--scenario`) and returns its results.
+    """
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *argv, "--scenario", name],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stdout.strip().splitlines()
+    print("\n".join(output[:-1]))
+    return json.loads(output[-1])
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_FOLDER, text=True).strip()
+    except Exception:
+        return None
+
+def compare_with_previous(results: dict, previous_path: str):
+    """
+    Prints the throughput and p95 latency changes against a previous results file.
+    """
+    with open(previous_path) as file:
+        previous = json.load(file)
+    print(f"\nCompared with {os.path.basename(previous_path)} ({previous.get('git_revision')}):")
+    for name, result in results["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if not before or not before.get("requests_per_s") or not result.get("requests_per_s"):
+            continue
+        throughput = (result["requests_per_s"] / before["requests_per_s"] - 1) * 100
+        line = f"  {name:<24} req/s {throughput:+.1f}%"
+        if before.get("p95_s") and result.get("p95_s"):
+            line += f"  p95 {(result['p95_s'] / before['p95_s'] - 1) * 100:+.1f}%"
+        print(line)
+    return
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the Prompter engine against a local mock server.")
+    parser.add_argument("--requests", type=int, default=2000, help="Prompts of the batch scenario.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight (batch_size).")
+    parser.add_argument("--sequential-requests", type=int, default=50)
+    parser.add_argument("--stream-requests", type=int, default=20)
+    parser.add_argument("--csv-rows", type=int, default=5000)
+    parser.add_argument("--latency-median", type=float, default=0.2)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--label", default=None, help="Name of the results file.")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--scenario", choices=SCENARIOS, default=None, help=argparse.SUPPRESS)  # Child process mode
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = build_parser().parse_args(argv)
+    base_url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+    if args.scenario:
+        # Child process: run one scenario against the parent's mock server, results on the last line
+        with tempfile.TemporaryDirectory() as folder:
+            prompter = make_prompter(base_url)
+            result = run_scenario(args.scenario, scenario_fn(args.scenario, prompter, args, folder))
+        print(json.dumps(result))
+        return result
+
+    server = start_mock_server(args.port, args)
+    try:
+        scenarios = {name: run_scenario_process(name, argv) for name in SCENARIOS}
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "config": vars(args),
+        "scenarios": scenarios,
+    }
+    previous = sorted(glob.glob(os.path.join(RESULTS_FOLDER, "*.json")), key=os.path.getmtime)
+    if previous:
+        compare_with_previous(results, previous[-1])
+    if not args.no_save:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        name = args.label or time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_FOLDER, f"{name}.json")
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults saved to {path}")
+    return results
+
+if __name__ == "__main__":
+    main()
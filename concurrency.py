@@ -0,0 +1,223 @@
+import asyncio
+import collections
+import statistics
+import threading
+import time
+
+# Last concurrency limit reached per (base_url, model), used as the starting point of the next batch
+_LAST_LIMITS = {}
+_LAST_LIMITS_LOCK = threading.Lock()
+
+class AdaptiveConcurrency:
+    """
+    AIMD (additive increase, multiplicative decrease) limit on the number of requests in flight.
+
+    Every success raises the limit by 1/limit, i.e. about one slot per round trip. A 429/5xx
+    response, or a sustained latency rise, multiplies the limit by `decrease_factor`, at most once
+    per baseline latency so that a single burst of failures only counts once. Latency is judged
+    over windows of `window` requests: congestion is when the median of a window exceeds
+    `spike_factor` times the lowest median of the last `history` windows, so that the variance of
+    single responses on a healthy server never counts. With `adaptive=False` the limit stays fixed.
+    """
+    def __init__(
+        self,
+        initial: int = 16,  # Starting limit
+        min_limit: int = 1,
+        max_limit: int = 256,
+        adaptive: bool = True,
+        decrease_factor: float = 0.5,
+        spike_factor: float = 2.0,  # Window median above spike_factor x the reference counts as congestion
+        window: int = 32,  # Requests per latency window
+        history: int = 8,  # Windows over which the reference (lowest) median is taken
+        on_change=None,  # Called with the new limit whenever its integer value changes
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.adaptive = adaptive
+        self.decrease_factor = decrease_factor
+        self.spike_factor = spike_factor
+        self.on_change = on_change
+        self.baseline = None  # Moving average of successful latencies, in seconds
+        self.window = collections.deque(maxlen=window)  # Latencies of the current window
+        self.medians = collections.deque(maxlen=history)  # Medians of the last windows
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    @property
+    def current(self):
+        """
+        Integer number of requests allowed in flight.
+        """
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.current)
+            self.in_flight += 1
+        return
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+        return
+
+    def _set_limit(self, limit: float):
+        previous = self.current
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        if self.current != previous and self.on_change:
+            self.on_change(self.current)
+        return
+
+    def on_success(self, latency: float):
+        """
+        Reports a successful request and its latency (seconds).
+        """
+        if not self.adaptive:
+            return
+        self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+        self.window.append(latency)
+        if len(self.window) == self.window.maxlen:
+            median = statistics.median(self.window)
+            self.window.clear()
+            congested = bool(self.medians) and median > self.spike_factor * min(self.medians)
+            self.medians.append(median)
+            if congested:
+                self.on_congestion()
+                return
+        self._set_limit(self.limit + 1 / self.limit)
+        return
+
+    def on_congestion(self):
+        """
+        Reports an overload signal (429, 5xx, timeout or latency spike).
+        """
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        if now - self.last_decrease < (self.baseline or 0.0):
+            return
+        self.last_decrease = now
+        self._set_limit(self.limit * self.decrease_factor)
+        return
+
+def get_last_limit(base_url: str, model_name: str, default: int):
+    with _LAST_LIMITS_LOCK:
+        return _LAST_LIMITS.get((base_url, model_name), default)
+
+def set_last_limit(base_url: str, model_name: str, limit: int):
+    with _LAST_LIMITS_LOCK:
+        _LAST_LIMITS[(base_url, model_name)] = limit
+    return
+
+class CancelToken:
+    """
+    Cooperative stop signal for a job, set by `cancel()` (e.g. from a UI thread) or by a deadline.
+    A token with a parent is also cancelled with its parent.
+    """
+    def __init__(
+        self,
+        deadline: float = None,  # Time budget of the job from now, in seconds. None for no deadline
+        parent: "CancelToken" = None,
+        event=None,  # Underlying event, e.g. a multiprocessing.Event shared with worker processes
+    ):
+        self.event = event if event is not None else threading.Event()
+        self.deadline = None if deadline is None else time.monotonic() + deadline
+        self.parent = parent
+
+    def cancel(self):
+        self.event.set()
+        return
+
+    @property
+    def cancelled(self):
+        """
+        Whether the job was cancelled or ran past its deadline.
+        """
+        if self.parent is not None and self.parent.cancelled:
+            return True
+        return self.event.is_set() or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    @property
+    def reason(self):
+        """
+        "cancelled", "deadline exceeded" or None while the job may run.
+        """
+        if self.parent is not None and self.parent.cancelled:
+            return self.parent.reason
+        if self.event.is_set():
+            return "cancelled"
+        return "deadline exceeded" if self.cancelled else None
+
+    async def wait(self, poll: float = 0.1):
+        """
+        Returns once the token is cancelled or its deadline is reached.
+        """
+        while not self.cancelled:
+            await asyncio.sleep(poll)
+        return
+
+async def run_until_cancelled(
+    coro,
+    cancel_token: CancelToken = None,
+):
+    """
+    Awaits `coro`, cancelling it when the token is cancelled. Returns True if it ran to completion.
+    """
+    if cancel_token is None:
+        await coro
+        return True
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(cancel_token.wait())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    if task.cancelled():
+        return False
+    task.result()  # Propagate errors of the job
+    return True
+
+class BackgroundJob:
+    """
+    Runs `fn(job)` in a daemon thread, so that a UI can poll its progress and stop it.
+
+    The function reads `job.token` to stop cooperatively and may report through `job.progress`
+    and `job.errors`. Its return value, or the exception it raised, ends up in `job.result` /
+    `job.error`. `context` holds whatever the caller needs to render the results.
+    """
+    def __init__(
+        self,
+        fn,
+        deadline: float = None,  # Time budget of the job, in seconds
+        context: dict = None,
+    ):
+        self.token = CancelToken(deadline=deadline)
+        self.context = context or {}
+        self.progress = None
+        self.errors = []
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(fn,), daemon=True)
+        self.thread.start()
+
+    def _run(self, fn):
+        try:
+            self.result = fn(self)
+        except BaseException as e:
+            # Including CancelledError, so that a job never ends without a result or an error
+            self.error = e
+        return
+
+    @property
+    def done(self):
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        self.token.cancel()
+        return
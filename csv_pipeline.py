@@ -0,0 +1,148 @@
+import asyncio
+import pandas as pd
+
+from prompter import Prompter, run_async
+from concurrency import CancelToken
+
+# Number of CSV rows read, completed and written at a time
+DEFAULT_CHUNKSIZE = 1000
+
+def _fill_missing_completions(
+    chunk: pd.DataFrame,
+    completion_column: str,
+):
+    """
+    Makes sure the completion column exists and can hold strings, and returns the mask of rows to complete.
+    """
+    if completion_column not in chunk.columns:
+        chunk[completion_column] = ""
+    chunk[completion_column] = chunk[completion_column].astype(object)
+    return chunk[completion_column].isna() | (chunk[completion_column] == "")
+
+def restore_from_journal(
+    df: pd.DataFrame,
+    completion_column: str,
+    missing: pd.Series,
+    journaled: dict,
+):
+    """
+    Fills missing completions of `df` from journaled ones ({row: completion}) and updates
+    the `missing` mask in place.
+
+    Returns:
+        int: The number of restored rows.
+    """
+    restored = [row for row in df.index[missing] if row in journaled]
+    if restored:
+        df.loc[restored, completion_column] = [journaled[row] for row in restored]
+        missing.loc[restored] = False
+    return len(restored)
+
+async def _complete_chunk(
+    chunk: pd.DataFrame,
+    prompter: Prompter,
+    text_column: str,
+    completion_column: str,
+    journaled: dict,
+    journal,
+    error_callback,
+    result_callback,
+    batch_kwargs: dict,
+):
+    """
+    Completes the missing rows of one chunk with one prompter, in place.
+    """
+    missing = _fill_missing_completions(chunk, completion_column)
+    restore_from_journal(chunk, completion_column, missing, journaled)
+    if not missing.any():
+        return
+    # Chunks keep the global row index, report errors and results with it
+    missing_rows = chunk.index[missing]
+    chunk_error_callback = None
+    if error_callback:
+        chunk_error_callback = lambda i, message: error_callback(int(missing_rows[i]), message)
+    def chunk_result_callback(i, completion):
+        if journal:
+            journal.record(missing_rows[i], prompter.model_name, completion)
+        if result_callback:
+            result_callback(int(missing_rows[i]), prompter.model_name, completion)
+    prompts = await asyncio.to_thread(prompter.render_prompts, chunk.loc[missing, text_column])
+    completions = await prompter.async_generate_batch(
+        prompts=prompts,
+        error_callback=chunk_error_callback,
+        result_callback=chunk_result_callback,
+        rendered=True,
+        **batch_kwargs,
+    )
+    chunk.loc[missing, completion_column] = completions
+    return
+
+def _write_chunk(
+    chunk: pd.DataFrame,
+    output,  # Output file opened for writing
+    header: bool,
+):
+    chunk.to_csv(output, header=header, index=False)
+    output.flush()
+    return
+
+async def async_complete_csv(
+    prompters: list[Prompter],
+    input_file,  # Path or file-like object of the input CSV
+    output_path: str,  # Path of the completed CSV written incrementally
+    text_column: str,
+    completion_columns: list[str],
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    progress_callback=None,  # Called with the number of rows written so far
+    error_callback=None,  # Called with (row index, error message) for failed rows
+    journal=None,  # Optional CompletionJournal to resume from and record into
+    result_callback=None,  # Called with (row index, model name, completion) for each new completion
+    deadline: float = None,  # Time budget of the whole job, in seconds
+    cancel_token: CancelToken = None,  # Stops the job when cancelled
+    **batch_kwargs,  # Forwarded to Prompter.async_generate_batch
+):
+    """
+    Completes a CSV file chunk by chunk with bounded memory.
+
+    Each chunk is read, its rows with missing completions are sent through the batch engines of
+    all prompters concurrently, and the completed chunk is appended to `output_path` before the next one is read.
+    With a journal, rows already journaled are filled in without any request and every new
+    completion is journaled as soon as it arrives.
+    When the job is cancelled or runs past its deadline, the current chunk is written with the
+    completions received so far and no further chunk is read.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if deadline is not None:
+        cancel_token = CancelToken(deadline=deadline, parent=cancel_token)
+    if cancel_token is not None:
+        batch_kwargs["cancel_token"] = cancel_token
+    rows_done = 0
+    journaled = [journal.completed(p.model_name) if journal else {} for p in prompters]
+    with open(output_path, "w", newline="", encoding="utf-8") as output:
+        # Parsing and writing run in worker threads, so that the event loop (possibly shared
+        # with other jobs) only serves requests
+        reader = await asyncio.to_thread(pd.read_csv, input_file, chunksize=chunksize)
+        chunk_number = 0
+        while (chunk := await asyncio.to_thread(next, reader, None)) is not None:
+            # Every model completes its missing rows of the chunk concurrently
+            await asyncio.gather(*[
+                _complete_chunk(chunk, prompter, text_column, completion_column, done, journal, error_callback, result_callback, batch_kwargs)
+                for prompter, completion_column, done in zip(prompters, completion_columns, journaled)
+            ])
+
+            await asyncio.to_thread(_write_chunk, chunk, output, chunk_number == 0)
+            chunk_number += 1
+            rows_done += len(chunk)
+            if progress_callback:
+                progress_callback(rows_done)
+            if cancel_token is not None and cancel_token.cancelled:
+                break
+    return rows_done
+
+def complete_csv(*args, **kwargs):
+    """
+    Synchronous wrapper of `async_complete_csv`, running it with `run_async`.
+    """
+    return run_async(async_complete_csv(*args, **kwargs))
@@ -1,25 +1,113 @@
+import asyncio
+import queue
 import streamlit as st
-from prompter import Prompter
+from prompter import Prompter, submit_async
+
+async def stream_answer(
+    prompter:Prompter,
+    history:list[dict],
+    area,
+    timeout:float=None,
+):
+    """
+    Streams one model's answer into an element and appends it to the history.
+    The answer is cut short, keeping what was received, once `timeout` seconds have elapsed.
+    `area` only needs a `markdown(text)` method (see `QueuedArea`).
+    """
+    chunks = []
+
+    async def consume():
+        async for delta in prompter.async_generate_stream(prompt_dicts=history):
+            chunks.append(delta)
+            area.markdown("".join(chunks) + "▌")
+
+    try:
+        await asyncio.wait_for(consume(), timeout=timeout)
+        content = "".join(chunks)
+    except asyncio.TimeoutError:
+        content = "".join(chunks) + f"\n\n⚠️ No complete response after {timeout:g}s."
+    except Exception as e:
+        content = "".join(chunks) + f"\n\n⚠️ Error while generating response: {e}"
+    area.markdown(content)
+    history.append({"role": "assistant", "content": content})
+    return
+
+async def stream_turn(
+    prompters:list[Prompter],
+    histories:list[list[dict]],
+    areas:list,
+    timeout:float=None,
+):
+    """
+    Queries all models of a chat turn concurrently, each filling its own element as it answers.
+    """
+    await asyncio.gather(*[
+        stream_answer(prompter, history, area, timeout=timeout)
+        for prompter, history, area in zip(prompters, histories, areas)
+    ])
+    return
+
+class QueuedArea:
+    """
+    Stand-in for a Streamlit element updated from the event loop thread: the updates are queued
+    and applied by the script thread (see `render_queued`), Streamlit calls being bound to it.
+    """
+    def __init__(self, area, updates:queue.Queue):
+        self.area = area
+        self.updates = updates
+
+    def markdown(self, text:str):
+        self.updates.put((self.area, text))
+
+def render_queued(future, updates:queue.Queue, poll:float=0.05):
+    """
+    Applies queued element updates on the script thread until `future` is done.
+    """
+    try:
+        while True:
+            done = future.done()
+            try:
+                while True:
+                    area, text = updates.get_nowait()
+                    area.markdown(text)
+            except queue.Empty:
+                pass
+            if done:
+                return future.result()
+            try:
+                future.result(timeout=poll)
+            except Exception:
+                pass
+    except BaseException:
+        # The script was interrupted (e.g. rerun): stop generating
+        future.cancel()
+        raise
 
 def chat_mode(
     prompters:list[Prompter],
     max_histories:int=5,
     chat_input_key:str="chat_input",
     conv_histories_key:str="messages_histories",
-    clear_button_key:str="clear_history"
+    clear_button_key:str="clear_history",
+    response_timeout:float=120,
 ):
     """Chat mode tab functionality with streaming."""
     num_models = len(prompters)
     st.subheader("Chat with the Model" if num_models==1 else "Chat with the Models")
 
+    pending_key = conv_histories_key+"_pending"  # Set when a user turn still awaits its answers
     if conv_histories_key not in st.session_state:
         st.session_state[conv_histories_key] = [[] for _ in range(max_histories)]
+    pending = st.session_state.get(pending_key, False)
 
     # Display chat messages
+    placeholders = []  # Containers receiving the streamed answers of the pending turn
     if num_models == 1:
         for message in st.session_state[conv_histories_key][0]:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        if pending:
+            placeholders.append(st.empty())
     else:
         user_messages = [msg["content"] for msg in st.session_state[conv_histories_key][0] if msg["role"] == "user"]
         for turn_index, user_message in enumerate(user_messages):
@@ -36,19 +124,31 @@ def chat_mode(
                     assistant_messages = [msg["content"] for msg in st.session_state[conv_histories_key][model_index] if msg["role"] == "assistant"]
                     if turn_index < len(assistant_messages):
                         st.chat_message("assistant").write(assistant_messages[turn_index])
+                    elif pending and turn_index == len(user_messages) - 1:
+                        placeholders.append(st.empty())
+
+    # Stream the answers of the pending turn into their placeholders
+    if pending:
+        st.session_state[pending_key] = False
+        histories = st.session_state[conv_histories_key][:num_models]
+        areas = []
+        for placeholder in placeholders:
+            with placeholder.container():
+                with st.chat_message("assistant"):
+                    areas.append(st.empty())
+        # All models answer concurrently; a stuck provider is cut off after `response_timeout`
+        updates = queue.Queue()
+        future = submit_async(stream_turn(prompters, histories, [QueuedArea(a, updates) for a in areas], timeout=response_timeout))
+        render_queued(future, updates)
 
    # User input
     def add_message():
         user_message = st.session_state[chat_input_key].strip()
         if user_message:
-            for i, history in enumerate(st.session_state[conv_histories_key][:num_models]):
+            for history in st.session_state[conv_histories_key][:num_models]:
                 history.append({"role": "user", "content": user_message})
-                try:
-                    with st.spinner(f"Generating response for Model {i + 1}..." if num_models > 1 else "Generating response..."):
-                        model_response = prompters[i].generate(prompt_dicts=history)
-                        history.append({"role": "assistant", "content": model_response})
-                except Exception as e:
-                    history.append({"role": "assistant", "content": f"⚠️ Error while generating response: {e}"})
+            # Answers are streamed on the rerun following the submission
+            st.session_state[pending_key] = True
 
     st.chat_input("Type your message", key=chat_input_key, on_submit=add_message)
     st.button("Clear Chat", key=clear_button_key, on_click=lambda: st.session_state.update({conv_histories_key: [[] for _ in range(max_histories)]}))
\ No newline at end of file
@@ -1,15 +1,64 @@
 import streamlit as st
-from prompter import Prompter
+from prompter import Prompter, generate_batches
+from response_cache import get_response_cache
+from csv_pipeline import complete_csv, restore_from_journal, DEFAULT_CHUNKSIZE
+from batch_api import MAX_BATCH_REQUESTS
+from journal import get_journal, make_job_id
+from concurrency import BackgroundJob
 import pandas as pd
+import tempfile
+import copy
+import io
 from utils import *
 
+# Seconds between two refreshes of a running job's progress
+JOB_POLL_INTERVAL = 0.5
+
+def freeze_prompters(prompters:list[Prompter]):
+    """
+    Copies of the prompters for a background job: reruns of the app keep reconfiguring the
+    session's prompters (template, layout, generation args, cache) while the job runs.
+    """
+    frozen = []
+    for p in prompters:
+        p = copy.copy(p)
+        # Generation args are updated in place by the sidebar
+        p._set_generation_args(dict(p.generation_args))
+        frozen.append(p)
+    return frozen
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def job_progress(
+    job:BackgroundJob,
+    stop_job_key:str,
+    waiting_message:str,  # Shown until the job reports its progress
+):
+    """
+    Progress of a running job with its Stop button, refreshed on its own without rerunning the
+    whole app. Once the job ends, the app is rerun to show the results.
+    """
+    if job.done:
+        st.rerun()
+    st.button("Stop", key=stop_job_key, on_click=job.cancel, help="Stop the job and keep the completions received so far.")
+    st.info(job.progress or waiting_message)
+    for row_index, error_message in job.errors:
+        st.error(f"Row {row_index}: {error_message}")
+
 def csv_upload_mode(
     prompters:list[Prompter],
     csv_upload_key:str="csv_upload",
     yaml_upload_key:str="yaml_upload",
     select_template_key:str="template_selection",
     select_column_key:str="column_to_complete",
-    download_completed_key:str="download_completed"
+    download_completed_key:str="download_completed",
+    use_cache_key:str="use_cache",
+    large_file_key:str="large_file_mode",
+    discard_journal_key:str="discard_journal",
+    prompt_layout_key:str="prompt_layout",
+    plan_job_key:str="plan_job",
+    stop_job_key:str="stop_job",
+    deadline_key:str="job_deadline",
+    backend_key:str="request_backend",
 ):
     """CSV upload and completion mode tab functionality."""
     num_models = len(prompters)
@@ -32,21 +81,44 @@ def csv_upload_mode(
 
     if selected_template_file:
         # Display template name and description
-        with open(os.path.join(templates_folder, selected_template_file), 'r') as file:
-            template = yaml.safe_load(file)
-            st.write(f"**Template Name:** {template.get('name', 'Unnamed Template')}")
-            st.write(f"**Description:** {template_descriptions[selected_template_file]}")
+        template = get_template(os.path.join(templates_folder, selected_template_file))
+        st.write(f"**Template Name:** {template['name']}")
+        st.write(f"**Description:** {template['description']}")
         # Load the chosen template
         for p in prompters:
-            p.load_prompt_template(open(os.path.join(templates_folder, selected_template_file)).read())
+            p.load_prompt_template(template["content"])
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
+        # Large file mode: only a preview is loaded, the file is completed chunk by chunk on disk
+        large_file_mode = st.checkbox(
+            "Large file mode (constant memory)",
+            key=large_file_key,
+            help="Read, complete and write the CSV in chunks instead of loading it whole.",
+        )
+        if large_file_mode:
+            df = pd.read_csv(uploaded_file, nrows=5)
+            uploaded_file.seek(0)
+        else:
+            df = pd.read_csv(uploaded_file)
         if uploaded_template:
             for p in prompters:
                 p.load_prompt_template(uploaded_template.getvalue())
         st.write("Preview of uploaded file:", df.head())
         text_column = st.selectbox("Select Text Column for Completion:", df.columns, key=select_column_key)
+        # Static template text can be sent as a shared leading message, cached by providers across rows
+        prompt_layout = st.selectbox(
+            "Prompt layout:",
+            options=["single", "system", "user"],
+            format_func=lambda x: {
+                "single": "Single user message",
+                "system": "Shared prefix as system message",
+                "user": "Shared prefix as leading user message",
+            }[x],
+            key=prompt_layout_key,
+            help="Shared-prefix layouts send the template text before {text} as a separate, identical leading message on every row, so that providers can reuse its prefill.",
+        )
+        for p in prompters:
+            p._set_prompt_layout(prompt_layout)
         # Display prompt example
         st.write(f"**Prompt example:**\n\n {prompters[0].make_prompt(list(df[text_column])[0])}")
 
@@ -70,32 +142,182 @@ def csv_upload_mode(
                 df[cc] = ""
             else:
                 st.warning(f"Column '{cc}' alredy exists. It will be overwritten.")
+                df[cc] = df[cc].astype(object)
+
+        # Completions are journaled as they arrive: resume a job interrupted on the same file and template
+        journal = get_journal(make_job_id(uploaded_file.getvalue(), prompters[0].prompt_template))
+        if journal.entries:
+            if st.button("Discard saved progress", key=discard_journal_key, help="Ignore completions saved by previous runs of this job."):
+                journal.clear()
+        if not large_file_mode:
+            for p, cc in zip(prompters, completion_columns):
+                restored = restore_from_journal(df, cc, df[cc].isna() | (df[cc] == ""), journal.completed(p.model_name))
+                if restored:
+                    st.info(f"{restored} completions of '{cc}' restored from a previous run.")
 
         # Identify rows with missing completions
         missing_indices = [df[df[cc].isna() | (df[cc] == "")].index for cc in completion_columns]
-        if num_models == 1:
+        if large_file_mode:
+            st.write("Rows with missing completions are detected chunk by chunk during generation.")
+        elif num_models == 1:
             st.write(f"Rows with missing completions: {len(missing_indices[0])}")
         else:
             missing_strs = [f"- {cc} : {len(mi)}" for mi, cc in zip(missing_indices, completion_columns)]
             st.write("Rows with missing completions:\n\n\t"+"\n\n\t".join(missing_strs))
 
-        if st.button("Generate Completions"):
+        # Opt-in on-disk response cache (only deterministic requests unless forced)
+        use_cache = st.checkbox(
+            "Cache responses on disk",
+            key=use_cache_key,
+            help="Reuse completions of identical requests across runs. Requests with temperature > 0 are not cached.",
+        )
+        for p in prompters:
+            p._set_cache(get_response_cache() if use_cache else None)
+
+        # Dry run: request volume, tokens and duration, without sending anything
+        if st.button("Estimate Job (dry run)", key=plan_job_key):
+            with st.spinner("Counting tokens..."):
+                if large_file_mode:
+                    # Only the text column is loaded to render the prompts
+                    texts = pd.read_csv(uploaded_file, usecols=[text_column])[text_column]
+                    uploaded_file.seek(0)
+                    plans = [p.plan_batch(p.render_prompts(texts), rendered=True) for p in prompters]
+                else:
+                    plans = [
+                        p.plan_batch(p.render_prompts(df.loc[mi, text_column]), rendered=True)
+                        for p, mi in zip(prompters, missing_indices)
+                    ]
+            st.dataframe(pd.DataFrame(plans))
+            estimated = [plan["model"] for plan in plans if plan["token_count"] == "estimate"]
+            if estimated:
+                st.caption(
+                    f"Token counts of {', '.join(estimated)} are estimated from the text length: the tokenizer "
+                    "couldn't be loaded from the HuggingFace Hub (gated model without a HuggingFace token, or no connection)."
+                )
+
+        # Jobs run in a background thread so that they can be stopped from the UI
+        job_state_key = stop_job_key + "_job"
+        time_limit = st.number_input(
+            "Time limit (minutes, 0 for none):",
+            min_value=0.0,
+            value=0.0,
+            step=5.0,
+            key=deadline_key,
+            help="Stop the job after this time and keep the completions received so far.",
+        )
+        deadline = time_limit * 60 or None
+        # Very large jobs can go through the provider's offline batch API, slower but cheaper
+        backend = st.selectbox(
+            "Request mode:",
+            options=["chat", "batch"],
+            format_func=lambda x: {"chat": "Chat completions (live)", "batch": "Batch API (offline, up to 24h)"}[x],
+            key=backend_key,
+            help="The batch API uploads all prompts as one job (/v1/files + /v1/batches) and returns the results once the provider has processed them. Not every provider supports it.",
+        )
+
+        # A second job would replace the running one in the session state
+        job = st.session_state.get(job_state_key)
+        job_running = job is not None and not job.done
+        if st.button("Generate Completions", disabled=job_running, help="Stop the running job first." if job_running else None):
             if not st.session_state["log_status"]:
                 st.error("⚠️ API is not connected. Please check your HuggingFace API token in the sidebar.")
+            elif large_file_mode:
+                job_prompters = freeze_prompters(prompters)
+                output_path = tempfile.NamedTemporaryFile(suffix=".csv", delete=False).name
+                # Reruns keep reading the uploaded file, the job gets its own copy
+                input_file = io.BytesIO(uploaded_file.getvalue())
+                st.session_state[job_state_key] = BackgroundJob(
+                    lambda job: complete_csv(
+                        prompters=job_prompters,
+                        input_file=input_file,
+                        output_path=output_path,
+                        text_column=text_column,
+                        completion_columns=completion_columns,
+                        progress_callback=lambda n: setattr(job, "progress", f"Rows written: {n}"),
+                        error_callback=lambda i, message: job.errors.append((i, message)),
+                        journal=journal,
+                        cancel_token=job.token,
+                        # Batches are submitted chunk by chunk, make each chunk a full batch
+                        chunksize=MAX_BATCH_REQUESTS if backend == "batch" else DEFAULT_CHUNKSIZE,
+                        backend=backend,
+                    ),
+                    deadline=deadline,
+                    context={"large_file_mode": True, "output_path": output_path},
+                )
             else:
-                for i, prompter in enumerate(prompters):
-                    with st.spinner("Generating completions..." if num_models==1 else f"Generating completions for Model {i+1}..."):
-                        try:
-                            # Generate completions only for rows with missing values
-                            prompts = df.loc[missing_indices[i], text_column].tolist()
-                            completions = prompter.generate_batch(prompts=prompts, **{'error_callback':report_error_to_streamlit})
-                            # Update the DataFrame with new completions
-                            for idx, completion in zip(missing_indices[i], completions):
-                                df.at[idx, completion_columns[i]] = completion
-
-                            st.success("Completions added!" if num_models==1 else f"Completions added for Model {i+1}!")
-                        except Exception as e:
-                            st.error(f"⚠️ Error while generating completions: {e}")
+                job_prompters = freeze_prompters(prompters)
+                def run_job(job):
+                    completed = [0] * num_models
+                    def on_result(model, row, completion):
+                        # Journal each completion under its row index as soon as it arrives
+                        journal.record(row, job_prompters[model].model_name, completion)
+                        completed[model] += 1
+                        job.progress = "Completions received: " + ", ".join(
+                            f"{n}/{len(mi)}" for n, mi in zip(completed, missing_indices)
+                        )
+                    # Generate completions only for rows with missing values, all models concurrently
+                    return generate_batches(
+                        prompters=job_prompters,
+                        prompts_lists=[p.render_prompts(df.loc[mi, text_column]) for p, mi in zip(job_prompters, missing_indices)],
+                        # Prompts are numbered by position in each model's list: report their row index
+                        batch_kwargs_list=[
+                            {
+                                "result_callback": lambda j, c, m=m, rows=mi: on_result(m, rows[j], c),
+                                "error_callback": lambda j, message, m=m, rows=mi: job.errors.append(
+                                    (rows[j], f"{job_prompters[m].model_name}: {message}")
+                                ),
+                            }
+                            for m, mi in enumerate(missing_indices)
+                        ],
+                        rendered=True,
+                        cancel_token=job.token,
+                        backend=backend,
+                    )
+                st.session_state[job_state_key] = BackgroundJob(
+                    run_job,
+                    deadline=deadline,
+                    context={"large_file_mode": False, "missing_indices": missing_indices},
+                )
+
+        job = st.session_state.get(job_state_key)
+        if job is not None and not job.done:
+            job_progress(
+                job,
+                stop_job_key,
+                "Generating completions..." if num_models==1 else f"Generating completions for {num_models} models...",
+            )
+        elif job is not None:
+            for row_index, error_message in job.errors:
+                report_error_to_streamlit(row_index, error_message)
+            if job.error is not None:
+                st.error(f"⚠️ Error while generating completions: {str(job.error) or type(job.error).__name__}")
+            elif job.token.reason:
+                st.warning(f"Job stopped ({job.token.reason}): the completions received so far are kept.")
+            if job.context["large_file_mode"]:
+                if job.error is None:
+                    st.success("Completions added!")
+                # Serve the download from the file written on disk
+                output_path = job.context["output_path"]
+                with open(output_path, "rb") as output_file:
+                    st.download_button(
+                        "Download Updated CSV",
+                        data=output_file,
+                        file_name="completed_file.csv",
+                        mime="text/csv",
+                        key=download_completed_key
+                    )
+                if os.path.getsize(output_path):
+                    st.write("Preview of updated file:", pd.read_csv(output_path, nrows=5))
+            elif job.error is None:
+                for i, completions in enumerate(job.result):
+                    if isinstance(completions, Exception):
+                        st.error(f"⚠️ Error while generating completions: {completions}")
+                        continue
+                    # Update the DataFrame with new completions
+                    for idx, completion in zip(job.context["missing_indices"][i], completions):
+                        if completion:
+                            df.at[idx, completion_columns[i]] = completion
+                    st.success("Completions added!" if num_models==1 else f"Completions added for Model {i+1}!")
 
                 # Provide download link for updated CSV
                 csv = df.to_csv(index=False).encode("utf-8")
@@ -0,0 +1,16 @@
+import streamlit as st
+import pandas as pd
+from metrics import summary, prometheus_text
+
+def metrics_panel():
+    """Request metrics tab: latency percentiles, errors and throughput per model."""
+    st.subheader("Request Metrics")
+    rows = summary()
+    if not rows:
+        st.info("No request sent yet.")
+        return
+
+    st.dataframe(pd.DataFrame(rows).round(3), hide_index=True)
+    st.caption("Percentiles over the latest requests of each model; latencies in seconds.")
+    with st.expander("Prometheus export"):
+        st.code(prometheus_text(), language="text")
@@ -105,13 +105,13 @@ def multimodels_compare():
     # =====================================================
 
     columns = st.columns(num_models)
-    # Initialize prompters
-    prompters = [Prompter() for _ in range(num_models)]
+    # Collect each model's configuration, the session's prompters are resolved once it is complete
+    configs = [Prompter() for _ in range(num_models)]
     for i, col in enumerate(columns):
         # Configure sidebar
         with col:
             configure_api(
-                prompter = prompters[i],
+                prompter = configs[i],
                 services_dict = SERVICES,
                 generation_args = DEFAULT_GEN_ARGS,
                 key_suffix=f"_multi_{i}",
@@ -130,10 +130,11 @@ def multimodels_compare():
 
             if selected_model:
                 try:
-                    prompters[i]._set_model(selected_model)
+                    configs[i]._set_model(selected_model)
                     st.success(f"Model set to: {selected_model}")
                 except Exception as e:
                     st.error(f"Failed to set model: {e}")
+    prompters = [session_prompter(c, key=f"prompter_multi_{i}") for i, c in enumerate(configs)]
 
     # Mode selection: Chat or CSV
     st.write("### Select Mode")
@@ -156,7 +157,15 @@ def multimodels_compare():
             yaml_upload_key="yaml_upload_multi",
             select_template_key="template_selection_multi",
             select_column_key="column_to_complete_multi",
-            download_completed_key="download_completed_multi"
+            download_completed_key="download_completed_multi",
+            use_cache_key="use_cache_multi",
+            large_file_key="large_file_mode_multi",
+            discard_journal_key="discard_journal_multi",
+            prompt_layout_key="prompt_layout_multi",
+            plan_job_key="plan_job_multi",
+            stop_job_key="stop_job_multi",
+            deadline_key="job_deadline_multi",
+            backend_key="request_backend_multi",
         )
 
 
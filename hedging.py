@@ -0,0 +1,182 @@
+import asyncio
+import threading
+
+from metrics import percentile, increment, provider_name
+
+# Hedges that can be fired in a row when the budget has accumulated
+HEDGE_BURST = 5
+
+class HedgePolicy:
+    """
+    When and how often to duplicate a slow request (hedged requests).
+
+    A request that hasn't answered after the `quantile`-th percentile of the recent latencies
+    (time to first token for streams) is sent a second time, to `alternate` if given or else to
+    the same endpoint, and the first answer wins. The budget caps the extra load: each request
+    earns `budget` hedges (e.g. 0.05 allows about 5% duplicates), up to `HEDGE_BURST` in reserve.
+    """
+    def __init__(
+        self,
+        quantile: float = 95,  # Percentile of the latency history after which to hedge
+        budget: float = 0.05,  # Hedges allowed per request, on average
+        min_delay: float = 0.5,  # Never hedge sooner than this, in seconds
+        min_samples: int = 20,  # Latencies to observe before hedging
+        default_delay: float = None,  # Delay used until `min_samples` are observed, None to wait
+        alternate=None,  # Prompter receiving the duplicates, e.g. another provider of the model
+    ):
+        self.quantile = quantile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.alternate = alternate
+        self.credits = 1.0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def delay(self, latencies: list):
+        """
+        Seconds to wait before hedging, given the recent latencies. None when not hedging.
+        """
+        if len(latencies) < self.min_samples:
+            delay = self.default_delay
+        else:
+            delay = percentile(latencies, self.quantile)
+        return None if delay is None else max(delay, self.min_delay)
+
+    def on_request(self):
+        with self.lock:
+            self.credits = min(HEDGE_BURST, self.credits + self.budget)
+        return
+
+    def take(self):
+        """
+        Spends one hedge from the budget. Returns False when the budget is exhausted.
+        """
+        with self.lock:
+            if self.credits < 1:
+                return False
+            self.credits -= 1
+            return True
+
+def _count(prompter, outcome: str):
+    increment(
+        "llm_hedges_total",
+        provider=provider_name(prompter.base_url),
+        model=prompter.model_name or "",
+        outcome=outcome,
+    )
+    return
+
+async def _race(
+    policy: HedgePolicy,
+    delay: float,
+    primary,  # Coroutine function sending the original request
+    hedge,  # Coroutine function sending the duplicate
+    discard=None,  # Coroutine function releasing the result of a finished loser
+):
+    """
+    Runs `primary`, starts `hedge` after `delay` if still pending and the budget allows, and
+    returns the first successful result with the outcome of the hedge: None if none was sent,
+    "won" or "lost". The pending request is cancelled. Fails only if both requests fail.
+    """
+    tasks = [asyncio.ensure_future(primary())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not policy.take():
+            return await tasks[0], None
+        tasks.append(asyncio.ensure_future(hedge()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in tasks if task in done and task.exception() is None), None)
+            if winner is not None:
+                for task in done:
+                    if task is not winner and task.exception() is None and discard is not None:
+                        await discard(task.result())
+                return winner.result(), "won" if winner is tasks[1] else "lost"
+            error = next(task for task in done).exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def hedged_request(
+    prompter,
+    prompt_dicts: list[dict],
+    attempt: int = 0,
+):
+    """
+    Sends a chat completion request through `prompter._async_request`, hedged by its policy.
+    """
+    policy = prompter.hedging
+    policy.on_request()
+    delay = policy.delay(prompter._latency_history())
+    if delay is None:
+        return await prompter._async_request(prompt_dicts, attempt=attempt)
+    target = policy.alternate or prompter
+    content, outcome = await _race(
+        policy,
+        delay,
+        lambda: prompter._async_request(prompt_dicts, attempt=attempt),
+        lambda: target._async_request(prompt_dicts, attempt=attempt),
+    )
+    if outcome is not None:
+        _count(prompter, outcome)
+    return content
+
+async def _first_delta(stream):
+    """
+    Waits for the first text delta of a stream. Returns (stream, delta), delta being None if empty.
+    """
+    async for delta in stream:
+        return stream, delta
+    return stream, None
+
+async def _close(result):
+    await result[0].aclose()
+    return
+
+async def hedged_stream(
+    prompter,
+    prompt_dicts: list[dict],
+):
+    """
+    Streams a response through `prompter._async_stream`, hedged by its policy on the time to first
+    token: the stream that starts first is kept and the other one is closed.
+    """
+    policy = prompter.hedging
+    policy.on_request()
+    delay = policy.delay(prompter._latency_history("ttft"))
+    if delay is None:
+        async for delta in prompter._async_stream(prompt_dicts):
+            yield delta
+        return
+    target = policy.alternate or prompter
+    (stream, delta), outcome = await _race(
+        policy,
+        delay,
+        lambda: _first_delta(prompter._async_stream(prompt_dicts)),
+        lambda: _first_delta(target._async_stream(prompt_dicts)),
+        discard=_close,
+    )
+    if outcome is not None:
+        _count(prompter, outcome)
+    if delta is None:
+        return
+    try:
+        yield delta
+        async for delta in stream:
+            yield delta
+    finally:
+        await stream.aclose()
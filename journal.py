@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_JOURNAL_FOLDER = ".cache/journals"
+
+def _job_id(
+    content_digest: str,
+    template: str = None,
+):
+    digest = hashlib.sha256(content_digest.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((template or "").encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def make_job_id(
+    data: bytes,  # Content of the input file
+    template: str = None,  # Prompt template applied to the rows
+):
+    """
+    Identifies a completion job by the content of its input file and its prompt template.
+    """
+    return _job_id(hashlib.sha256(data).hexdigest(), template)
+
+def make_file_job_id(
+    path: str,  # Path of the input file
+    template: str = None,  # Prompt template applied to the rows
+    block_size: int = 1 << 20,
+):
+    """
+    Same as `make_job_id`, hashing the input file block by block instead of loading it.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return _job_id(digest.hexdigest(), template)
+
+class CompletionJournal:
+    """
+    Append-only JSONL journal of the completions of a job, one line per (row, model).
+
+    Completions are appended as soon as they arrive, so a job interrupted midway can be
+    relaunched and skip the rows already completed.
+    """
+    def __init__(
+        self,
+        path: str,
+    ):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}  # (model_name, row) -> completion
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+        self.file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def for_job(
+        cls,
+        job_id: str,
+        folder: str = DEFAULT_JOURNAL_FOLDER,
+    ):
+        """
+        Opens the journal of a job in the journals folder.
+        """
+        return cls(os.path.join(folder, f"{job_id}.jsonl"))
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line may be truncated if the process died while writing it
+                    continue
+                self.entries[(entry["model"], entry["row"])] = entry["completion"]
+        return
+
+    def completed(
+        self,
+        model_name: str,
+    ):
+        """
+        Returns the completions already journaled for a model, as a {row: completion} dict.
+        """
+        return {row: c for (model, row), c in self.entries.items() if model == model_name}
+
+    def record(
+        self,
+        row: int,
+        model_name: str,
+        completion: str,
+    ):
+        """
+        Appends a completion to the journal and flushes it to the OS right away.
+        """
+        row = int(row)
+        line = json.dumps({"row": row, "model": model_name, "completion": completion}, ensure_ascii=False)
+        with self.lock:
+            self.entries[(model_name, row)] = completion
+            self.file.write(line + "\n")
+            self.file.flush()
+        return
+
+    def clear(self):
+        """
+        Discards every journaled completion.
+        """
+        with self.lock:
+            self.entries = {}
+            self.file.close()
+            self.file = open(self.path, "w", encoding="utf-8")
+        return
+
+    def close(self):
+        self.file.close()
+        return
+
+
+# Journals shared across reruns and sessions of the same server process
+_JOURNALS = {}
+_JOURNALS_LOCK = threading.Lock()
+
+def get_journal(
+    job_id: str,
+    folder: str = DEFAULT_JOURNAL_FOLDER,
+):
+    """
+    Returns the process-wide CompletionJournal of a job.
+    """
+    with _JOURNALS_LOCK:
+        if job_id not in _JOURNALS:
+            _JOURNALS[job_id] = CompletionJournal.for_job(job_id, folder)
+        return _JOURNALS[job_id]
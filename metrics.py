@@ -0,0 +1,231 @@
+import collections
+import http.server
+import threading
+import time
+import urllib.parse
+
+# Number of latest requests kept per endpoint and model for percentiles
+HISTORY_SIZE = 1000
+# Upper bounds of the latency histogram buckets exported to Prometheus, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_LOCK = threading.Lock()
+_HISTORY = {}  # (base_url, model_name) -> deque of request records
+_COUNTERS = collections.defaultdict(float)  # (metric name, labels) -> value
+_HOOKS = []  # Functions called with every request record
+
+def provider_name(base_url: str):
+    """
+    Short provider tag of an endpoint (its host name).
+    """
+    return urllib.parse.urlparse(base_url or "").netloc or (base_url or "")
+
+def add_metrics_hook(fn):
+    """
+    Registers a function called with the record of every request (see `record_request`).
+    """
+    _HOOKS.append(fn)
+    return
+
+def record_request(
+    base_url: str,
+    model_name: str,
+    status,  # HTTP status code, or an error name when no response was received
+    latency: float,  # Wall time of the request, in seconds
+    ttft: float = None,  # Time to first token of streamed requests, in seconds
+    prompt_tokens: int = None,
+    output_tokens: int = None,
+    attempt: int = 0,  # 0 for the first attempt, n for the n-th retry
+):
+    """
+    Records one request attempt.
+    """
+    record = {
+        "time": time.time(),
+        "provider": provider_name(base_url),
+        "model": model_name,
+        "status": str(status),
+        "latency": latency,
+        "ttft": ttft,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "output_tokens_per_s": output_tokens / latency if output_tokens and latency else None,
+        "attempt": attempt,
+    }
+    labels = (("provider", record["provider"]), ("model", model_name or ""))
+    with _LOCK:
+        history = _HISTORY.get((base_url, model_name))
+        if history is None:
+            history = collections.deque(maxlen=HISTORY_SIZE)
+            _HISTORY[(base_url, model_name)] = history
+        history.append(record)
+        _COUNTERS[("llm_requests_total", labels + (("status", record["status"]),))] += 1
+        if attempt:
+            _COUNTERS[("llm_retries_total", labels)] += 1
+        _COUNTERS[("llm_request_latency_seconds_sum", labels)] += latency
+        _COUNTERS[("llm_request_latency_seconds_count", labels)] += 1
+        # Every bucket is created, even when empty: Prometheus expects the full set per series
+        for bound in LATENCY_BUCKETS:
+            _COUNTERS[("llm_request_latency_seconds_bucket", labels + (("le", str(bound)),))] += latency <= bound
+        _COUNTERS[("llm_request_latency_seconds_bucket", labels + (("le", "+Inf"),))] += 1
+        if prompt_tokens:
+            _COUNTERS[("llm_prompt_tokens_total", labels)] += prompt_tokens
+        if output_tokens:
+            _COUNTERS[("llm_output_tokens_total", labels)] += output_tokens
+    for hook in list(_HOOKS):
+        hook(record)
+    return record
+
+def get_latencies(
+    base_url: str,
+    model_name: str,
+    field: str = "latency",  # "latency", or "ttft" for the time to first token of streams
+):
+    """
+    Returns the latest latencies (seconds) of successful requests to an endpoint and model.
+    """
+    with _LOCK:
+        history = list(_HISTORY.get((base_url, model_name), ()))
+    return [r[field] for r in history if r["status"].startswith("2") and r[field] is not None]
+
+def percentile(values: list, q: float):
+    """
+    q-th percentile (0-100) of a list of values, by nearest rank. None for an empty list.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+def summary():
+    """
+    Per endpoint and model statistics over the recent requests: volume, errors, retries,
+    latency and time-to-first-token percentiles, output throughput.
+
+    Returns:
+        list[dict]: One row per (provider, model).
+    """
+    with _LOCK:
+        histories = {k: list(v) for k, v in _HISTORY.items()}
+    rows = []
+    for (base_url, model_name), records in histories.items():
+        ok = [r for r in records if r["status"].startswith("2")]
+        latencies = [r["latency"] for r in ok]
+        ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+        throughputs = [r["output_tokens_per_s"] for r in ok if r["output_tokens_per_s"]]
+        rows.append({
+            "provider": provider_name(base_url),
+            "model": model_name,
+            "requests": len(records),
+            "errors": len(records) - len(ok),
+            "retries": sum(1 for r in records if r["attempt"]),
+            "p50_s": percentile(latencies, 50),
+            "p95_s": percentile(latencies, 95),
+            "p99_s": percentile(latencies, 99),
+            "p50_ttft_s": percentile(ttfts, 50),
+            "output_tokens_per_s": sum(throughputs) / len(throughputs) if throughputs else None,
+            "concurrency_limit": get_gauge("llm_concurrency_limit", provider=provider_name(base_url), model=model_name or ""),
+        })
+    return rows
+
+def set_gauge(
+    name: str,
+    value: float,
+    **labels,
+):
+    """
+    Sets a gauge exported to Prometheus under `name`.
+    """
+    with _LOCK:
+        _COUNTERS[(name, tuple(sorted(labels.items())))] = value
+    return
+
+def increment(
+    name: str,
+    value: float = 1,
+    **labels,
+):
+    """
+    Adds `value` to a counter exported to Prometheus under `name` (ending in `_total`).
+    """
+    with _LOCK:
+        _COUNTERS[(name, tuple(sorted(labels.items())))] += value
+    return
+
+def get_gauge(
+    name: str,
+    **labels,
+):
+    """
+    Returns the current value of a gauge, or None if it was never set.
+    """
+    with _LOCK:
+        return _COUNTERS.get((name, tuple(sorted(labels.items()))))
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _histogram_order(sample):
+    """
+    Sort key of histogram samples: per series, the buckets by increasing bound, then sum and count.
+    """
+    name, labels, _ = sample
+    le = dict(labels).get("le")
+    series = tuple(label for label in labels if label[0] != "le")
+    return (series, not name.endswith("_bucket"), float(le) if le else 0.0, name)
+
+def prometheus_text():
+    """
+    Renders all metrics in the Prometheus text exposition format.
+    """
+    with _LOCK:
+        items = list(_COUNTERS.items())
+    # Group samples by metric family
+    families = {}
+    for (name, labels), value in items:
+        family = name
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.startswith("llm_request_latency_seconds") and name.endswith(suffix):
+                family = name[:-len(suffix)]
+        families.setdefault(family, []).append((name, labels, value))
+    lines = []
+    for family, samples in families.items():
+        if family == "llm_request_latency_seconds":
+            metric_type = "histogram"
+            samples.sort(key=_histogram_order)
+        elif family.endswith("_total"):
+            metric_type = "counter"
+        else:
+            metric_type = "gauge"
+        lines.append(f"# TYPE {family} {metric_type}")
+        for name, labels, value in samples:
+            label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+            lines.append(f"{name}{{{label_str}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        return
+
+_SERVER = None
+
+def start_metrics_server(port: int = 9100, host: str = "127.0.0.1"):
+    """
+    Serves the Prometheus metrics over HTTP from a background thread (once per process).
+    Only local clients can connect by default; bind `host` to "0.0.0.0" to expose it.
+    """
+    global _SERVER
+    with _LOCK:
+        if _SERVER is None:
+            _SERVER = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_SERVER.serve_forever, daemon=True).start()
+    return _SERVER
@@ -0,0 +1,110 @@
+import functools
+import os
+import statistics
+
+from rate_limiter import CHARS_PER_TOKEN, resolve_rate_limits
+from metrics import get_latencies
+from concurrency import get_last_limit
+
+# Latency assumed for models without any observed request, in seconds
+DEFAULT_LATENCY = 5.0
+
+@functools.lru_cache(maxsize=32)
+def get_tokenizer(
+    model_name: str,
+    token: str = None,  # HuggingFace token, needed for gated repos. None for the Hub's default (`HF_TOKEN`)
+):
+    """
+    Loads the tokenizer of a model from the HuggingFace Hub, or None if unavailable.
+
+    The `tokenizer.json` file is fetched through `huggingface_hub` and cached on disk; when the
+    Hub cannot be reached, the cached copy is used. Provider suffixes such as `:free` are ignored.
+    Requires the optional `tokenizers` package.
+    """
+    if not model_name:
+        return None
+    try:
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+    except ImportError:
+        return None
+    repo_id = model_name.split(":")[0]
+    for local_files_only in (False, True):
+        try:
+            path = hf_hub_download(repo_id, "tokenizer.json", token=token, local_files_only=local_files_only)
+            return Tokenizer.from_file(path)
+        except Exception:
+            continue
+    return None
+
+def count_tokens(
+    texts: list[str],
+    model_name: str = None,
+    token: str = None,  # HuggingFace token, for gated tokenizers
+):
+    """
+    Counts the tokens of each text with the model's tokenizer, or estimates them from
+    their length when no tokenizer is available.
+
+    Returns:
+        tuple: (list of token counts, whether the model tokenizer was used).
+    """
+    tokenizer = get_tokenizer(model_name, token)
+    if tokenizer is None:
+        return [len(t) // CHARS_PER_TOKEN + 1 for t in texts], False
+    return [len(e.ids) for e in tokenizer.encode_batch(list(texts), add_special_tokens=False)], True
+
+def plan_job(
+    prompter,
+    prompts,  # Rendered prompts (list or Series)
+    batch_size: int = 16,
+):
+    """
+    Estimates the volume and duration of a batch job without sending any request.
+
+    The duration is bounded by the slowest of: the concurrency (requests in flight at the median
+    observed latency), the requests-per-minute quota and the tokens-per-minute quota. The
+    concurrency is the limit the adaptive controller starts from: the last one reached on this
+    endpoint and model, or `batch_size`. It may grow during the job, so the estimate is an upper bound.
+
+    Returns:
+        dict: Rows, requests, input/output token counts, latency used, request rate and estimated duration.
+    """
+    prompts = list(prompts)
+    # Identical prompts are sent once at deterministic settings
+    unique_prompts = list(dict.fromkeys(prompts)) if prompter._is_deterministic() else prompts
+    # Gated tokenizers need a HuggingFace token: the prompter's when it targets HuggingFace
+    hub_token = prompter._hub_token() or os.environ.get("HF_API_TOKEN")
+    token_counts, exact = count_tokens(unique_prompts, prompter.model_name, hub_token)
+    input_tokens = sum(token_counts)
+    max_tokens = int(prompter.generation_args.get("max_tokens", 0) or 0)
+    n_requests = len(unique_prompts)
+
+    latencies = get_latencies(prompter.base_url, prompter.model_name)
+    latency = statistics.median(latencies) if latencies else DEFAULT_LATENCY
+
+    # Request rate allowed by each constraint, in requests per second
+    concurrency = get_last_limit(prompter.base_url, prompter.model_name, batch_size)
+    rates = {"concurrency": concurrency / latency}
+    limits, _ = resolve_rate_limits(prompter.rate_limits, prompter.model_name)
+    if limits.get("requests_per_minute"):
+        rates["requests per minute"] = limits["requests_per_minute"] / 60
+    if limits.get("tokens_per_minute") and n_requests:
+        tokens_per_request = input_tokens / n_requests + max_tokens
+        rates["tokens per minute"] = limits["tokens_per_minute"] / 60 / tokens_per_request
+    bottleneck = min(rates, key=rates.get)
+
+    return {
+        "model": prompter.model_name,
+        "rows": len(prompts),
+        "requests": n_requests,
+        "input_tokens": input_tokens,
+        "max_output_tokens": n_requests * max_tokens,
+        "token_count": "tokenizer" if exact else "estimate",
+        "latency_s": round(latency, 2),
+        "latency_source": f"median of {len(latencies)} requests" if latencies else "default",
+        "initial_concurrency": concurrency,
+        "requests_per_s": round(rates[bottleneck], 3),
+        "bottleneck": bottleneck,
+        "estimated_duration_s": round(n_requests / rates[bottleneck], 1),
+    }
@@ -0,0 +1,300 @@
+import random
+import time
+
+from prompter import Prompter, is_retryable, DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from metrics import get_latencies
+
+# Consecutive failures after which an endpoint is taken out of rotation
+FAILURE_THRESHOLD = 3
+# Time out of rotation after the threshold is reached, doubled on each new trip (seconds)
+COOLDOWN_BASE = 15.0
+COOLDOWN_CAP = 300.0
+# Latency assumed for endpoints without any observed request (seconds)
+DEFAULT_ENDPOINT_LATENCY = 2.0
+
+def canonical_model_name(model_name: str):
+    """
+    Provider-independent model identifier: lower case, without suffixes such as `:free`.
+    """
+    return (model_name or "").split(":")[0].lower()
+
+class Endpoint:
+    """
+    One member of a pool: a Prompter bound to a single provider, with its health state.
+    """
+    def __init__(self, prompter: Prompter, name: str = None):
+        self.prompter = prompter
+        self.name = name or prompter.base_url
+        self.in_flight = 0
+        self.failures = 0  # Consecutive failures
+        self.trips = 0  # Times the endpoint was taken out of rotation in a row
+        self.down_until = 0.0
+
+    def available(self, now: float):
+        return now >= self.down_until
+
+    def latency(self):
+        latencies = get_latencies(self.prompter.base_url, self.prompter.model_name)[-50:]
+        return sorted(latencies)[len(latencies) // 2] if latencies else DEFAULT_ENDPOINT_LATENCY
+
+    def score(self, tokens: int = 0):
+        """
+        Expected time to serve one more request: latency scaled by the load, plus the wait for quota.
+        """
+        limiter = self.prompter._rate_limiter()
+        quota_delay = limiter.expected_delay(tokens) if limiter is not None else 0.0
+        return self.latency() * (1 + self.in_flight) + quota_delay
+
+    def on_success(self):
+        self.failures = 0
+        self.trips = 0
+        return
+
+    def on_failure(self):
+        self.failures += 1
+        if self.failures >= FAILURE_THRESHOLD:
+            self.down_until = time.monotonic() + min(COOLDOWN_CAP, COOLDOWN_BASE * 2 ** self.trips)
+            self.trips += 1
+            self.failures = 0
+        return
+
+class PrompterPool(Prompter):
+    """
+    A Prompter spreading its requests over several equivalent endpoints serving the same model.
+
+    Each request goes to the endpoint with the lowest expected service time (observed median
+    latency, current load and remaining rate-limit quota). Endpoints failing repeatedly are taken
+    out of rotation for a growing cooldown, and a failed request is retried at once on another
+    endpoint. Templates, layouts and batching are handled by the pool as by a single Prompter;
+    the generation arguments and cache are shared with every member.
+    """
+    def __init__(
+        self,
+        model_name: str = None,  # Display name of the pooled model
+    ):
+        super().__init__(base_url="pool:" + (model_name or ""))
+        self.model_name = model_name
+        self.endpoints = []
+
+    def add_endpoint(
+        self,
+        base_url: str,
+        token: str,
+        model_name: str = None,  # Name of the model on this provider, defaults to the pool's
+        rate_limits: dict = None,
+        cache_control: bool = False,
+        name: str = None,
+    ):
+        """
+        Adds an endpoint serving the pooled model.
+        """
+        prompter = Prompter(base_url=base_url)
+        prompter._set_token(token)
+        prompter._set_model(model_name or self.model_name)
+        prompter._set_rate_limits(rate_limits)
+        prompter._set_cache_control(cache_control)
+        prompter._set_generation_args(self.generation_args)
+        prompter._set_cache(self.cache, self.force_cache)
+        prompter._set_timeouts(self.connect_timeout, self.read_timeout)
+        self.endpoints.append(Endpoint(prompter, name=name))
+        return self
+
+    @classmethod
+    def from_services(
+        cls,
+        services_dict: dict,
+        model_name: str,
+        tokens: dict,  # Service key (e.g. "API:HF") -> API token
+    ):
+        """
+        Builds a pool over every service of `services.json` listing the model (ignoring case and
+        provider suffixes such as `:free`) and for which a token is given.
+        """
+        pool = cls(model_name=model_name)
+        for key, service in services_dict.items():
+            if not tokens.get(key):
+                continue
+            for available in service.get("available_models", []):
+                if canonical_model_name(available) == canonical_model_name(model_name):
+                    pool.add_endpoint(
+                        base_url=service["base_url"],
+                        token=tokens[key],
+                        model_name=available,
+                        rate_limits=service.get("rate_limits"),
+                        cache_control=service.get("cache_control", False),
+                        name=service.get("name", key),
+                    )
+                    break
+        return pool
+
+    # =============================================
+    def _set_generation_args(self, generation_args: dict = {}):
+        super()._set_generation_args(generation_args)
+        for endpoint in self.endpoints:
+            endpoint.prompter._set_generation_args(generation_args)
+        return
+
+    def _set_cache(self, cache=None, force: bool = False):
+        super()._set_cache(cache, force)
+        for endpoint in self.endpoints:
+            endpoint.prompter._set_cache(cache, force)
+        return
+
+    def _set_timeouts(self, connect: float = DEFAULT_CONNECT_TIMEOUT, read: float = DEFAULT_READ_TIMEOUT):
+        super()._set_timeouts(connect, read)
+        for endpoint in self.endpoints:
+            endpoint.prompter._set_timeouts(connect, read)
+        return
+
+    def _budget_share(self, share: float):
+        pool = super()._budget_share(share)
+        pool.endpoints = [Endpoint(e.prompter._budget_share(share), name=e.name) for e in self.endpoints]
+        return pool
+
+    def _set_cache_control(self, enabled: bool = False):
+        # Cache-control support is a property of each provider, set in `add_endpoint` and
+        # applied per request in `_endpoint_messages`
+        return
+
+    def _credentials(self):
+        return tuple((e.prompter.base_url, e.prompter.token) for e in self.endpoints)
+
+    def _hub_token(self):
+        return next((t for t in (e.prompter._hub_token() for e in self.endpoints) if t), None)
+
+    def _latency_history(self, field: str = "latency"):
+        return [latency for endpoint in self.endpoints for latency in endpoint.prompter._latency_history(field)]
+
+    def _rate_limiter(self):
+        # Quotas are enforced by each endpoint
+        return None
+
+    def _candidates(self, prompt_dicts: list[dict]):
+        """
+        Endpoints ordered by preference for a request: available ones by score (with a small
+        random jitter to spread ties), then the ones out of rotation by end of cooldown.
+        """
+        if not self.endpoints:
+            raise ValueError("The pool has no endpoint.")
+        now = time.monotonic()
+        tokens = self._estimate_tokens(prompt_dicts)
+        available = [e for e in self.endpoints if e.available(now)]
+        available.sort(key=lambda e: e.score(tokens) * random.uniform(1.0, 1.1))
+        down = sorted((e for e in self.endpoints if not e.available(now)), key=lambda e: e.down_until)
+        return available + down
+
+    def _endpoint_messages(
+        self,
+        endpoint: Endpoint,
+        prompt_dicts: list[dict],
+    ):
+        """
+        Messages sent to one endpoint: the leading static prefix message (see `make_messages`)
+        carries a cache-control hint when that provider supports them.
+        """
+        prefix = self.static_prefix.strip()
+        if not endpoint.prompter.cache_control or self.prompt_layout == "single" or len(prompt_dicts) < 2:
+            return prompt_dicts
+        first = prompt_dicts[0]
+        if first["role"] != self.prompt_layout or first["content"] != prefix:
+            return prompt_dicts
+        return [{**first, "content": endpoint.prompter._static_content(prefix)}] + prompt_dicts[1:]
+
+    # =============================================
+    def generate(
+        self,
+        prompt_dicts: list[dict],
+        stream: bool = False,
+    ):
+        if stream:
+            return self.generate_stream(prompt_dicts)
+        last_error = None
+        for endpoint in self._candidates(prompt_dicts):
+            endpoint.in_flight += 1
+            try:
+                content = endpoint.prompter.generate(self._endpoint_messages(endpoint, prompt_dicts))
+                endpoint.on_success()
+                return content
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    raise
+                endpoint.on_failure()
+            finally:
+                endpoint.in_flight -= 1
+        raise last_error
+
+    def generate_stream(
+        self,
+        prompt_dicts: list[dict],
+    ):
+        last_error = None
+        for endpoint in self._candidates(prompt_dicts):
+            started = False
+            endpoint.in_flight += 1
+            try:
+                for delta in endpoint.prompter.generate_stream(self._endpoint_messages(endpoint, prompt_dicts)):
+                    started = True
+                    yield delta
+                endpoint.on_success()
+                return
+            except Exception as e:
+                last_error = e
+                # A partially delivered answer can't be resumed elsewhere
+                if started or not is_retryable(e):
+                    raise
+                endpoint.on_failure()
+            finally:
+                endpoint.in_flight -= 1
+        raise last_error
+
+    async def _async_stream(
+        self,
+        prompt_dicts: list[dict],
+    ):
+        last_error = None
+        for endpoint in self._candidates(prompt_dicts):
+            started = False
+            endpoint.in_flight += 1
+            try:
+                async for delta in endpoint.prompter.async_generate_stream(self._endpoint_messages(endpoint, prompt_dicts)):
+                    started = True
+                    yield delta
+                endpoint.on_success()
+                return
+            except Exception as e:
+                last_error = e
+                if started or not is_retryable(e):
+                    raise
+                endpoint.on_failure()
+            finally:
+                endpoint.in_flight -= 1
+        raise last_error
+
+    async def _async_request(
+        self,
+        prompt_dicts: list[dict],
+        attempt: int = 0,
+    ):
+        last_error = None
+        for endpoint in self._candidates(prompt_dicts):
+            endpoint.in_flight += 1
+            try:
+                content = await endpoint.prompter._async_request(self._endpoint_messages(endpoint, prompt_dicts), attempt=attempt)
+                endpoint.on_success()
+                return content
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    raise
+                endpoint.on_failure()
+            finally:
+                endpoint.in_flight -= 1
+        raise last_error
+
+    async def async_generate_batch(self, prompts: list, *args, **kwargs):
+        """
+        Same as `Prompter.async_generate_batch`; the default concurrency cap covers all endpoints.
+        """
+        kwargs.setdefault("max_concurrency", DEFAULT_POOL_SIZE * max(1, len(self.endpoints)))
+        return await super().async_generate_batch(prompts, *args, **kwargs)
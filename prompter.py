@@ -1,23 +1,325 @@
 import requests
+import aiohttp
 import json
-import yaml
 import asyncio
+import weakref
+import threading
+import concurrent.futures
+import random
+import email.utils
+import time
 import os
+import string
+import copy
+import contextvars
+import pandas as pd
+
+from rate_limiter import get_rate_limiter, estimate_tokens, scale_rate_limits
+from response_cache import ResponseCache
+from utils import parse_template_content
+from metrics import record_request, set_gauge, provider_name, get_latencies
+from planner import plan_job
+from concurrency import AdaptiveConcurrency, CancelToken, get_last_limit, set_last_limit, run_until_cancelled
+from hedging import HedgePolicy, hedged_request, hedged_stream
 
 # Constants for API endpoints
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"  # Default URL for OpenRouter API
 HF_URL = "https://api-inference.huggingface.co/v1/chat/completions"  # Alternate URL for HuggingFace API
 
+# Maximum number of open connections per base URL in the async pool
+DEFAULT_POOL_SIZE = 256
+
+# Per-request timeouts (seconds): establishing the connection, and waiting for data from the server
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+
+# Retry backoff parameters (seconds)
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# HTTP status codes worth retrying: timeouts, rate limits and server-side errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class APIError(Exception):
+    """
+    Error returned by the API (non-2xx status or a body without completions).
+
+    Attributes:
+        status_code (int): HTTP status of the response.
+        retry_after (float): Delay requested by the server through the `Retry-After` header, if any.
+    """
+    def __init__(self, message:str, status_code:int=None, retry_after:float=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def parse_retry_after(value:str):
+    """
+    Parses a `Retry-After` header value (delay in seconds or HTTP date) into seconds.
+    Returns None when the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error:Exception):
+    """
+    Whether a failed request is worth retrying: rate limits, 5xx, connection resets and timeouts.
+    """
+    if isinstance(error, APIError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, (
+        asyncio.TimeoutError,
+        ConnectionError,
+        aiohttp.ClientConnectionError,
+        aiohttp.ClientPayloadError,
+        requests.ConnectionError,
+        requests.Timeout,
+    ))
+
+def retry_delay(error:Exception, retry:int):
+    """
+    Delay before the next attempt: the server's `Retry-After` when given,
+    otherwise exponential backoff with full jitter.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        # Small jitter so that throttled requests don't all come back at the same instant
+        return min(BACKOFF_CAP, retry_after) + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** retry))
+
+def parse_sse_line(line):
+    """
+    Parses one line of a server-sent-events completion stream.
+
+    Returns:
+        str | None: The text delta carried by the line, "" for lines without content
+        (comments, keep-alives, role-only chunks), or None once the stream signals `[DONE]`.
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    chunk = json.loads(data)
+    if "error" in chunk:
+        raise APIError(f"Stream error: {chunk['error']}")
+    choices = chunk.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or ""
+
+def parse_completion(status_code:int, headers, content:bytes):
+    """
+    Checks the HTTP status of a chat completion response and returns its decoded JSON body.
+
+    Raises:
+        APIError: If the status is not 2xx or the body holds no completion.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        data = None
+    if status_code >= 400 or not isinstance(data, dict) or "choices" not in data:
+        message = data.get("error", data) if isinstance(data, dict) else content[:200].decode("utf-8", "replace")
+        raise APIError(
+            f"HTTP {status_code}: {message}",
+            status_code=status_code,
+            retry_after=parse_retry_after(headers.get("Retry-After")),
+        )
+    return data
+
+# =============================================
+# Shared connection pools
+#
+# Sync requests reuse one keep-alive `requests.Session` per base URL.
+# Async requests reuse one `aiohttp.ClientSession` per (event loop, base URL):
+# aiohttp sessions are bound to the loop they were created on, and
+# `generate_batch` runs each batch in a fresh loop via `asyncio.run`.
+_SYNC_SESSIONS = {}
+_ASYNC_SESSIONS = weakref.WeakKeyDictionary()
+# Deterministic requests currently in flight, per event loop: request key -> future of the response
+_IN_FLIGHT = weakref.WeakKeyDictionary()
+# Callback receiving the latency of every request actually sent by the current batch task
+# (cache hits and coalesced requests excluded), e.g. to drive its adaptive concurrency
+_LATENCY_OBSERVER = contextvars.ContextVar("latency_observer", default=None)
+
+def get_sync_session(base_url:str):
+    """
+    Returns the shared keep-alive `requests.Session` for a base URL.
+    """
+    session = _SYNC_SESSIONS.get(base_url)
+    if session is None:
+        session = requests.Session()
+        _SYNC_SESSIONS[base_url] = session
+    return session
+
+def get_async_session(base_url:str, pool_size:int=DEFAULT_POOL_SIZE):
+    """
+    Returns the shared `aiohttp.ClientSession` for a base URL on the running event loop.
+    Must be called from within a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    loop_sessions = _ASYNC_SESSIONS.setdefault(loop, {})
+    session = loop_sessions.get(base_url)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=60)
+        session = aiohttp.ClientSession(connector=connector)
+        loop_sessions[base_url] = session
+    return session
+
+async def close_async_sessions():
+    """
+    Closes every async session opened on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    loop_sessions = _ASYNC_SESSIONS.pop(loop, {})
+    for session in loop_sessions.values():
+        await session.close()
+    return
+
+class AsyncRunner:
+    """
+    A long-lived event loop running in a daemon thread.
+
+    Coroutines submitted from any thread run on the same loop, so the async connection pools
+    opened on it stay alive between calls (and between callers), instead of being closed
+    after every `run_async`. Set it as the process-wide runner with `set_async_runner`.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the loop and returns its `concurrent.futures.Future`.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the loop and waits for its result. The coroutine is cancelled if
+        the waiting thread is interrupted.
+        """
+        future = self.submit(coro)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        """
+        Closes the connection pools opened on the loop and stops it.
+        """
+        self.run(close_async_sessions())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        return
+
+# Process-wide runner used by `run_async`, None to run every coroutine in a fresh event loop
+_RUNNER = None
+
+def set_async_runner(runner: AsyncRunner = None):
+    global _RUNNER
+    _RUNNER = runner
+    return
+
+def submit_async(coro):
+    """
+    Starts a coroutine without waiting for it, on the async runner if set or else in a
+    fresh event loop in a new thread.
+
+    Returns:
+        concurrent.futures.Future: The future result of the coroutine.
+    """
+    if _RUNNER is not None:
+        return _RUNNER.submit(coro)
+    future = concurrent.futures.Future()
+    def _run():
+        try:
+            future.set_result(run_async(coro))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=_run, daemon=True).start()
+    return future
+
+def run_async(coro):
+    """
+    Runs a coroutine to completion: on the async runner if one is set (see `set_async_runner`),
+    otherwise in a fresh event loop whose connection pools are released afterwards.
+    """
+    if _RUNNER is not None and threading.current_thread() is not _RUNNER.thread:
+        return _RUNNER.run(coro)
+
+    async def _main():
+        try:
+            return await coro
+        finally:
+            await close_async_sessions()
+    return asyncio.run(_main())
+
 def worker(args):
     """
     Worker function to handle a single prompt with its index.
     This needs to be a top-level function for multiprocessing to work.
     """
     instance, index, prompt = args
-    prompt_dict = [{"role": "user", "content": instance.make_prompt(prompt)}]
+    prompt_dict = instance.make_messages(prompt)
     response = instance.generate(prompt_dicts=prompt_dict)
     return index, response
 
+async def sliding_window(
+    items,
+    coro_fn,
+    concurrency:int,
+    controller:AdaptiveConcurrency=None,
+):
+    """
+    Runs `coro_fn(item)` for every item while keeping at most `concurrency` calls in flight.
+
+    A new item is pulled from `items` as soon as any running call finishes, so a slow call
+    never holds back the others. Items are consumed lazily, which allows generators as input.
+    `coro_fn` is expected to handle its own errors; an exception cancels the remaining work.
+
+    Args:
+        items (iterable): The items to process.
+        coro_fn (function): Coroutine function called with each item.
+        concurrency (int): Maximum number of concurrent calls.
+        controller (AdaptiveConcurrency): Optional dynamic limit, below `concurrency`, on the calls in flight.
+    """
+    iterator = iter(items)
+    done = object()
+
+    async def _worker():
+        while True:
+            if controller is not None:
+                await controller.acquire()
+            try:
+                item = next(iterator, done)
+                if item is done:
+                    return
+                await coro_fn(item)
+            finally:
+                if controller is not None:
+                    await controller.release()
+
+    workers = [asyncio.create_task(_worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+    return
+
 class Prompter:
     """
     A class for making requests to LLM APIs
@@ -38,6 +340,16 @@ class Prompter:
         self.generation_args = {}  # Additional arguments for generation
         self.logged = False  # Reserved flag, possibly for logging activity (unused here)
         self.prompt_template = None
+        self.input_variables = ["text"]  # Variables declared by the prompt template
+        self.static_prefix = ""  # Template text before the first variable
+        self.prompt_layout = "single"  # How rendered prompts are split into messages
+        self.cache_control = False  # Mark the static prefix with provider cache-control hints
+        self.rate_limits = None  # `rate_limits` entry of the selected service in services.json
+        self.cache = None  # Optional ResponseCache for completions
+        self.force_cache = False  # Cache even non-deterministic (temperature > 0) requests
+        self.hedging = None  # Optional HedgePolicy duplicating slow async requests
+        self.connect_timeout = DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = DEFAULT_READ_TIMEOUT
 
     # =============================================
     def _set_base_url(
@@ -92,6 +404,109 @@ class Prompter:
         self.generation_args = generation_args
         return
 
+    def _set_rate_limits(
+        self,
+        rate_limits: dict = None,  # Request/token quotas of the service
+    ):
+        """
+        Sets the client-side rate limits, as declared under `rate_limits` in services.json.
+
+        Args:
+            rate_limits (dict): `requests_per_minute` / `tokens_per_minute` quotas, with optional
+                per-model overrides under `models`. None disables rate limiting.
+        """
+        self.rate_limits = rate_limits
+        return
+
+    def _set_cache(
+        self,
+        cache: ResponseCache = None,  # Response cache, None to disable caching
+        force: bool = False,
+    ):
+        """
+        Enables the on-disk response cache.
+
+        Args:
+            cache (ResponseCache): The cache to read from and write to. None disables caching.
+            force (bool): Also cache requests sampled with temperature > 0. Defaults to False.
+        """
+        self.cache = cache
+        self.force_cache = force
+        return
+
+    def _set_prompt_layout(
+        self,
+        layout: str = "single",  # "single", "system" or "user"
+    ):
+        """
+        Sets how templated prompts are laid out into messages (see `make_messages`).
+
+        Args:
+            layout (str): "single" sends the whole prompt as one user message; "system" / "user"
+                send the static template prefix as a leading message of that role.
+        """
+        if layout not in ("single", "system", "user"):
+            raise ValueError(f"Unknown prompt layout: {layout}")
+        self.prompt_layout = layout
+        return
+
+    def _set_cache_control(
+        self,
+        enabled: bool = False,
+    ):
+        """
+        Enables cache-control hints on the static prompt prefix, for providers supporting them.
+        """
+        self.cache_control = bool(enabled)
+        return
+
+    def _set_hedging(
+        self,
+        policy: HedgePolicy = None,  # Hedging policy, None to disable hedging
+    ):
+        """
+        Enables hedged requests: slow asynchronous requests (batches, async streams) are sent a
+        second time and the first answer wins.
+
+        Args:
+            policy (HedgePolicy): When to hedge, the hedge budget and the optional alternate endpoint.
+        """
+        self.hedging = policy
+        return
+
+    def _set_timeouts(
+        self,
+        connect: float = DEFAULT_CONNECT_TIMEOUT,  # Seconds to establish the connection
+        read: float = DEFAULT_READ_TIMEOUT,  # Seconds without data from the server
+    ):
+        """
+        Sets the per-request timeouts. A request timing out fails with a retryable error.
+
+        Args:
+            connect (float): Maximum time to establish the connection. None to wait forever.
+            read (float): Maximum time between two reads, i.e. until the response, or between
+                two chunks of a stream. None to wait forever.
+        """
+        self.connect_timeout = connect
+        self.read_timeout = read
+        return
+
+    def _budget_share(
+        self,
+        share: float,  # Fraction of the rate limits granted to the copy
+    ):
+        """
+        Returns a copy of the Prompter holding a fraction of its rate limits, e.g. for one of
+        several worker processes sharing the same quotas. The hedging alternate gets the same share.
+        """
+        prompter = copy.copy(self)
+        prompter._set_rate_limits(scale_rate_limits(self.rate_limits, share))
+        if self.hedging is not None and self.hedging.alternate is not None:
+            hedging = copy.copy(self.hedging)
+            hedging.alternate = self.hedging.alternate._budget_share(share)
+            prompter._set_hedging(hedging)
+        return prompter
+
     def _update_generation_arg(
         self,
         key,
@@ -103,10 +518,146 @@ class Prompter:
         self.generation_args[key] = value
         return 
     # =============================================
+    def _headers(self):
+        """
+        Builds the HTTP headers for API requests.
+        """
+        return {
+            "Authorization": f"Bearer {self.token}",  # Authorization header with token
+        }
+
+    def _payload(
+        self,
+        prompt_dicts: list[dict],
+        **kwargs,  # Request-specific fields (e.g. stream=True)
+    ):
+        """
+        Builds the JSON body of a chat completion request.
+        """
+        return {
+            "model": self.model_name,  # Model name for the request
+            "messages": prompt_dicts,  # Conversation history/messages
+            **self.generation_args,  # Additional generation arguments
+            **kwargs,
+        }
+
+    def _client_timeout(self):
+        """
+        Timeouts of async requests. No total timeout, so that long streams aren't cut short.
+        """
+        return aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+
+    def _credentials(self):
+        """
+        Credentials the responses depend on: requests are only coalesced between callers sharing them.
+        """
+        return self.token
+
+    def _hub_token(self):
+        """
+        Token for the HuggingFace Hub (e.g. gated tokenizers): the API token when the endpoint is HuggingFace's.
+        """
+        return self.token if "huggingface.co" in (self.base_url or "") else None
+
+    def _rate_limiter(self):
+        """
+        Returns the limiter shared by all Prompters targeting the same endpoint and token, if any.
+        """
+        return get_rate_limiter(self.base_url, self.token, self.rate_limits, self.model_name)
+
+    def _latency_history(
+        self,
+        field: str = "latency",  # "latency" or "ttft"
+    ):
+        """
+        Recent latencies of successful requests, from which the hedging delay is derived.
+        """
+        return get_latencies(self.base_url, self.model_name, field)
+
+    def _estimate_tokens(
+        self,
+        prompt_dicts: list[dict],
+    ):
+        return estimate_tokens(prompt_dicts, self.generation_args.get("max_tokens", 0))
+
+    def _is_deterministic(self):
+        """
+        Whether identical requests yield identical responses (greedy decoding).
+        """
+        return self.generation_args.get("temperature", 1.0) <= 0
+
+    def _group_prompts(
+        self,
+        prompts,
+        rendered: bool = False,  # Whether prompts are already rendered
+        error_callback=None,  # Called with (index, message) for prompts failing to render
+    ):
+        """
+        Groups identical prompts, compared once rendered since rows may be dicts of template values.
+        Prompts failing to render are reported to `error_callback` and left out.
+
+        Returns:
+            dict: Rendered prompt -> indices of the prompts rendering to it, in input order.
+        """
+        groups = {}
+        for i, prompt in enumerate(prompts):
+            try:
+                key = prompt if rendered else self.make_prompt(prompt)
+            except Exception as e:
+                if error_callback:
+                    error_callback(i, f"Error: {str(e)}")
+                continue
+            groups.setdefault(key, []).append(i)
+        return groups
+
+    def _cache_key(
+        self,
+        prompt_dicts: list[dict],
+    ):
+        """
+        Returns the cache key of a request, or None when the request should not be cached.
+        """
+        if self.cache is None:
+            return None
+        if not self._is_deterministic() and not self.force_cache:
+            return None
+        return ResponseCache.make_key(self.base_url, self.model_name, prompt_dicts, self.generation_args)
+
+    def _record_request(
+        self,
+        start: float,  # time.monotonic() when the request was sent
+        error: Exception = None,
+        data: dict = None,  # Decoded response body, for its `usage` token counts
+        ttft: float = None,
+        output_tokens: int = None,
+        attempt: int = 0,
+    ):
+        """
+        Reports one request attempt to the metrics registry.
+        """
+        if error is None:
+            status = 200
+        elif getattr(error, "status_code", None):
+            status = error.status_code
+        else:
+            status = type(error).__name__
+        usage = (data or {}).get("usage") or {}
+        record_request(
+            self.base_url,
+            self.model_name,
+            status=status,
+            latency=time.monotonic() - start,
+            ttft=ttft,
+            prompt_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens", output_tokens),
+            attempt=attempt,
+        )
+        return
+
     def generate(
         self,
         prompt_dicts: list[dict],  # List of message dictionaries defining the conversation
-        stream: bool = False,  # Flag for streaming responses (not implemented in this method)
+        stream: bool = False,  # Flag for streaming responses
     ):
         """
         Sends a request to the API to generate a response based on the given prompts.
@@ -116,93 +667,372 @@ class Prompter:
             stream (bool): Whether to stream the response. Defaults to False.
 
         Returns:
-            str: The content of the response message.
-        """
-        # Make a POST request to the API
-        response = requests.post(
-            url=self.base_url,
-            headers={
-                "Authorization": f"Bearer {self.token}",  # Authorization header with token
-            },
-            json={
-                "model": self.model_name,  # Model name for the request
-                "messages": prompt_dicts,  # Conversation history/messages
-                **self.generation_args  # Additional generation arguments
-            }
-        )
-        # Parse the API response and return the content of the first choice
-        return json.loads(response.content)["choices"][0]["message"]["content"]
+            str: The content of the response message, or a generator of text deltas if `stream` is True.
+        """
+        if stream:
+            return self.generate_stream(prompt_dicts)
+        cache_key = self._cache_key(prompt_dicts)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        # Wait for quota before sending the request
+        limiter = self._rate_limiter()
+        if limiter is not None:
+            limiter.acquire_sync(self._estimate_tokens(prompt_dicts))
+        # Make a POST request to the API over the shared keep-alive session
+        start = time.monotonic()
+        try:
+            response = get_sync_session(self.base_url).post(
+                url=self.base_url,
+                headers=self._headers(),
+                json=self._payload(prompt_dicts),
+                timeout=(self.connect_timeout, self.read_timeout),
+            )
+            # Parse the API response and return the content of the first choice
+            data = parse_completion(response.status_code, response.headers, response.content)
+        except Exception as e:
+            self._record_request(start, error=e)
+            raise
+        self._record_request(start, data=data)
+        content = data["choices"][0]["message"]["content"]
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
+
+    def generate_stream(
+        self,
+        prompt_dicts: list[dict],  # List of message dictionaries defining the conversation
+    ):
+        """
+        Streams the response through server-sent events, yielding text deltas as they arrive.
+
+        Args:
+            prompt_dicts (list[dict]): A list of message dictionaries containing the prompts.
+
+        Yields:
+            str: Successive pieces of the response message.
+        """
+        limiter = self._rate_limiter()
+        if limiter is not None:
+            limiter.acquire_sync(self._estimate_tokens(prompt_dicts))
+        start = time.monotonic()
+        ttft, n_chunks = None, 0  # Content chunks approximate output tokens
+        try:
+            with get_sync_session(self.base_url).post(
+                url=self.base_url,
+                headers=self._headers(),
+                json=self._payload(prompt_dicts, stream=True),
+                stream=True,
+                timeout=(self.connect_timeout, self.read_timeout),
+            ) as response:
+                if response.status_code >= 400:
+                    parse_completion(response.status_code, response.headers, response.content)
+                for line in response.iter_lines():
+                    delta = parse_sse_line(line)
+                    if delta is None:
+                        break
+                    if delta:
+                        if ttft is None:
+                            ttft = time.monotonic() - start
+                        n_chunks += 1
+                        yield delta
+        except Exception as e:
+            self._record_request(start, error=e, ttft=ttft)
+            raise
+        self._record_request(start, ttft=ttft, output_tokens=n_chunks)
+        return
+
+    async def async_generate_stream(
+        self,
+        prompt_dicts: list[dict],  # List of message dictionaries defining the conversation
+    ):
+        """
+        Asynchronous counterpart of `generate_stream`. With hedging enabled, a stream without a
+        first token after the hedging delay is duplicated and the first one to start is kept.
+
+        Yields:
+            str: Successive pieces of the response message.
+        """
+        stream = self._async_stream(prompt_dicts) if self.hedging is None else hedged_stream(self, prompt_dicts)
+        async for delta in stream:
+            yield delta
+
+    async def _async_stream(
+        self,
+        prompt_dicts: list[dict],
+    ):
+        """
+        Streams one chat completion on the event loop, going through the rate limiter.
+        """
+        limiter = self._rate_limiter()
+        if limiter is not None:
+            await limiter.acquire(self._estimate_tokens(prompt_dicts))
+        session = get_async_session(self.base_url)
+        start = time.monotonic()
+        ttft, n_chunks = None, 0  # Content chunks approximate output tokens
+        try:
+            async with session.post(
+                url=self.base_url,
+                headers=self._headers(),
+                json=self._payload(prompt_dicts, stream=True),
+                timeout=self._client_timeout(),
+            ) as response:
+                if response.status >= 400:
+                    parse_completion(response.status, response.headers, await response.read())
+                async for line in response.content:
+                    delta = parse_sse_line(line)
+                    if delta is None:
+                        break
+                    if delta:
+                        if ttft is None:
+                            ttft = time.monotonic() - start
+                        n_chunks += 1
+                        yield delta
+        except Exception as e:
+            self._record_request(start, error=e, ttft=ttft)
+            raise
+        self._record_request(start, ttft=ttft, output_tokens=n_chunks)
 
     async def async_generate(
         self,
         prompt_dicts,
         index:int,
+        attempt:int=0,  # Retry number, reported to the metrics
     ):
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(None, self.generate, prompt_dicts)
-        return index, response
+        """
+        Asynchronous counterpart of `generate`, running natively on the event loop.
+
+        Args:
+            prompt_dicts (list[dict]): A list of message dictionaries containing the prompts.
+            index (int): Position of the prompt in the batch, returned alongside the response.
+
+        Identical deterministic requests already in flight on the same event loop (e.g. from
+        parallel callers) with the same credentials are coalesced: they await the pending
+        response instead of being resent. If the request they wait for is cancelled, they send
+        their own.
+
+        Returns:
+            tuple: (index, content of the response message).
+        """
+        if not self._is_deterministic():
+            return index, await self._async_hedged_request(prompt_dicts, attempt=attempt)
+
+        key = (
+            self._credentials(),
+            ResponseCache.make_key(self.base_url, self.model_name, prompt_dicts, self.generation_args),
+        )
+        loop = asyncio.get_running_loop()
+        in_flight = _IN_FLIGHT.setdefault(loop, {})
+        while key in in_flight:
+            shared = in_flight[key]
+            try:
+                # Shield the shared request so that a cancelled follower doesn't cancel it for everyone
+                return index, await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                # The caller that sent it was cancelled, not this one: send the request again
+
+        future = loop.create_future()
+        in_flight[key] = future
+        try:
+            content = await self._async_hedged_request(prompt_dicts, attempt=attempt)
+            future.set_result(content)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # Mark as retrieved when no follower is waiting
+            raise
+        finally:
+            del in_flight[key]
+        return index, content
+
+    async def _async_hedged_request(
+        self,
+        prompt_dicts: list[dict],
+        attempt: int = 0,
+    ):
+        """
+        Sends one request with `_async_request`, hedged when a hedging policy is set.
+        """
+        if self.hedging is None:
+            return await self._async_request(prompt_dicts, attempt=attempt)
+        return await hedged_request(self, prompt_dicts, attempt=attempt)
+
+    async def _async_request(
+        self,
+        prompt_dicts: list[dict],
+        attempt: int = 0,
+    ):
+        """
+        Sends one chat completion request on the event loop, going through the cache and rate limiter.
+        """
+        cache_key = self._cache_key(prompt_dicts)
+        if cache_key is not None:
+            # SQLite I/O runs in a worker thread, the event loop being shared with other jobs
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        # Wait for quota before sending the request
+        limiter = self._rate_limiter()
+        if limiter is not None:
+            await limiter.acquire(self._estimate_tokens(prompt_dicts))
+        session = get_async_session(self.base_url)
+        start = time.monotonic()
+        try:
+            async with session.post(
+                url=self.base_url,
+                headers=self._headers(),
+                json=self._payload(prompt_dicts),
+                timeout=self._client_timeout(),
+            ) as response:
+                content = await response.read()
+                data = parse_completion(response.status, response.headers, content)
+        except Exception as e:
+            self._record_request(start, error=e, attempt=attempt)
+            raise
+        self._record_request(start, data=data, attempt=attempt)
+        observer = _LATENCY_OBSERVER.get()
+        if observer is not None:
+            # Measured from the end of the rate limiter wait
+            observer(time.monotonic() - start)
+        content = data["choices"][0]["message"]["content"]
+        if cache_key is not None:
+            await asyncio.to_thread(self.cache.set, cache_key, content)
+        return content
 
     async def async_generate_batch(
         self,
         prompts: list,  # List of prompt strings
         batch_size: int = 16,
-        max_retries: int = 0,  # Maximum retries for failed prompts
+        max_retries: int = 3,  # Maximum retries for failed prompts
         error_callback=None,  # Function to report errors to the Streamlit UI
+        result_callback=None,  # Function receiving each response as soon as it arrives
+        rendered: bool = False,  # Whether prompts are already rendered (see `render_prompts`)
+        adaptive: bool = True,  # Tune the number of requests in flight (AIMD)
+        max_concurrency: int = DEFAULT_POOL_SIZE,  # Upper bound of the adaptive limit
+        deadline: float = None,  # Time budget of the batch, in seconds
+        cancel_token: CancelToken = None,  # Stops the batch when cancelled
+        backend: str = "chat",  # "chat" for concurrent chat completions, "batch" for the offline batch API
+        poll_interval: float = None,  # Seconds between status checks of the "batch" backend
     ):
         """
         Generates responses for a batch of prompts with parallel requests and error handling.
 
+        Requests are scheduled over a sliding window: up to `batch_size` requests are kept in flight
+        and a new prompt is started as soon as any of them finishes. In adaptive mode the window
+        grows while latency holds and halves on 429/5xx or latency spikes, starting from the last
+        limit reached for this endpoint and model (see `AdaptiveConcurrency`). Each prompt is retried on
+        its own when the error is retryable (429, 5xx, connection resets, timeouts), honoring
+        `Retry-After` and otherwise backing off exponentially with jitter.
+        With a hedging policy set (see `_set_hedging`), stragglers are duplicated after the
+        hedging delay and the first answer is kept.
+        At deterministic settings (temperature 0), identical prompts are sent once and the
+        response is copied to every matching index.
+
         Args:
             prompts (list): A list of prompt strings.
-            batch_size (int): Number of prompts to process in parallel.
-            max_retries (int): Maximum number of retries for failed prompts.
+            batch_size (int): Maximum number of requests in flight at any time, or the initial limit in adaptive mode.
+            adaptive (bool): Adjust the number of requests in flight to the endpoint's capacity.
+            max_concurrency (int): Maximum number of requests in flight in adaptive mode.
+            max_retries (int): Maximum number of retries per failed prompt.
             error_callback (function): A callback function to log or display errors in the Streamlit app.
+            result_callback (function): Called with (index, response) for each successful prompt, as it completes.
+            rendered (bool): Skip `make_prompt`, the prompts being rendered already. Prompts are
+                then consumed lazily, e.g. straight from the Series returned by `render_prompts`.
+            deadline (float): Stop the batch after this many seconds. None for no deadline.
+            cancel_token (CancelToken): Stop the batch when the token is cancelled, e.g. from the UI.
+                On stop, requests in flight are cancelled and the responses received so far are returned.
+            backend (str): "chat" sends the prompts as concurrent chat completion requests, as
+                described above. "batch" submits them to the provider's offline batch API instead
+                (see `batch_api.async_batch_generate`), for very large jobs that can wait for results.
+            poll_interval (float): Seconds between status checks of submitted batches.
 
         Returns:
-            list: A list of response strings for each prompt. Failed prompts are replaced with error messages.
+            list: A list of response strings for each prompt, in input order. Failed prompts, and
+                prompts not completed before a stop, are left empty.
         """
+        if deadline is not None:
+            cancel_token = CancelToken(deadline=deadline, parent=cancel_token)
+
+        if backend == "batch":
+            # Imported here, the batch API client being built on this module
+            from batch_api import async_batch_generate, DEFAULT_POLL_INTERVAL
+            return await async_batch_generate(
+                self,
+                prompts,
+                rendered=rendered,
+                error_callback=error_callback,
+                result_callback=result_callback,
+                poll_interval=poll_interval or DEFAULT_POLL_INTERVAL,
+                cancel_token=cancel_token,
+            )
+        elif backend != "chat":
+            raise ValueError(f"Unknown backend: {backend}")
+
         if batch_size is None:
             batch_size = len(prompts)
 
-        indexed_prompts = [(i, p) for i, p in enumerate(prompts)]
         results = [""] * len(prompts)  # Placeholder for results
-        errors = {}
 
-        for i in range(0, len(indexed_prompts), batch_size):
-            batch = indexed_prompts[i:i + batch_size]  # Get the next batch
+        controller = None
+        if adaptive:
+            controller = AdaptiveConcurrency(
+                initial=get_last_limit(self.base_url, self.model_name, batch_size),
+                max_limit=max_concurrency,
+                # Expose the current limit in the metrics
+                on_change=lambda limit: set_gauge(
+                    "llm_concurrency_limit", limit, provider=provider_name(self.base_url), model=self.model_name or ""
+                ),
+            )
+            controller.on_change(controller.current)
 
-            # Create async tasks for the batch
-            tasks = [
-                self.async_generate(
-                    prompt_dicts=[{"role": "user", "content": self.make_prompt(id_prompt[1])}],
-                    index=id_prompt[0]
-                ) for id_prompt in batch
-            ]
-
-            # Run tasks concurrently and handle errors
+        async def process(indexed_prompt):
+            indices, prompt = indexed_prompt
+            index = indices[0]
+            if controller is not None:
+                # Only the latency of requests sent over the network feeds the controller
+                _LATENCY_OBSERVER.set(controller.on_success)
             for retry in range(max_retries + 1):
                 try:
-                    batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                    break  # Exit retry loop on success
+                    # Built inside the try, so that a malformed row only fails that row
+                    prompt_dicts = self.make_messages(prompt, rendered=rendered)
+                    _, response = await self.async_generate(prompt_dicts=prompt_dicts, index=index, attempt=retry)
+                    for i in indices:
+                        results[i] = response
+                        if result_callback:
+                            result_callback(i, response)
+                    return
                 except Exception as e:
-                    if retry < max_retries:
-                        await asyncio.sleep(2 ** retry)  # Exponential backoff
+                    if controller is not None and is_retryable(e):
+                        controller.on_congestion()
+                    if retry < max_retries and is_retryable(e):
+                        await asyncio.sleep(retry_delay(e, retry))
                     else:
-                        raise e
-
-            # Process results and handle errors
-            for idx, result in enumerate(batch_results):
-                original_index = batch[idx][0]
-                if isinstance(result, Exception):
-                    error_message = f"Error: {str(result)}"
-                    errors[original_index] = error_message
-                    results[original_index] = ""
-                    # Call the error callback if provided
-                    if error_callback:
-                        error_callback(original_index, error_message)
-                else:
-                    results[original_index] = result[1]
+                        error_message = f"Error: {str(e)}"
+                        # Call the error callback if provided
+                        if error_callback:
+                            for i in indices:
+                                error_callback(i, error_message)
+                        return
+
+        if self._is_deterministic():
+            # Collapse identical prompts into a single request
+            groups = self._group_prompts(prompts, rendered=rendered, error_callback=error_callback)
+            rendered = True  # Read by `process`: the grouped prompts are rendered
+            work = ((indices, prompt) for prompt, indices in groups.items())
+        else:
+            work = (([i], prompt) for i, prompt in enumerate(prompts))
 
+        if controller is not None:
+            window = sliding_window(work, process, concurrency=controller.max_limit, controller=controller)
+            await run_until_cancelled(window, cancel_token)
+            set_last_limit(self.base_url, self.model_name, controller.current)
+        else:
+            await run_until_cancelled(sliding_window(work, process, concurrency=batch_size), cancel_token)
         return results
 
     def generate_batch(
@@ -211,7 +1041,21 @@ class Prompter:
         **kwargs
     ):
         # Create and run the event loop if not in Jupyter
-        return asyncio.run(self.async_generate_batch(prompts, **kwargs))
+        return run_async(self.async_generate_batch(prompts, **kwargs))
+
+    def plan_batch(
+        self,
+        prompts,  # Prompts of the job
+        batch_size: int = 16,
+        rendered: bool = False,
+    ):
+        """
+        Dry run of `generate_batch`: counts requests and tokens and estimates the duration
+        from the concurrency, the rate limits and the observed latency. See `planner.plan_job`.
+        """
+        if not rendered:
+            prompts = [self.make_prompt(p) for p in prompts]
+        return plan_job(self, prompts, batch_size=batch_size)
 
     # =============================================
     def generate_more(
@@ -264,29 +1108,154 @@ class Prompter:
 
     # =============================================
     def make_prompt(
-        self, prompt:str,
+        self, prompt:str|dict,
     ):
+        """
+        Renders the prompt template for one row: `prompt` is the `{text}` value, or a dict of
+        values for templates declaring several input variables.
+        """
         if not self.prompt_template is None:
+            if isinstance(prompt, dict):
+                return self.prompt_template.format(**prompt)
             return self.prompt_template.format(text=prompt)
         return prompt
 
+    def make_messages(
+        self,
+        prompt:str|dict,
+        rendered:bool=False,  # Whether `prompt` is already rendered
+    ):
+        """
+        Builds the message list sent for one row, following `prompt_layout`.
+
+        With the "single" layout the rendered prompt is one user message. With the "system" or
+        "user" layouts, the static template text before the first variable is sent as a leading
+        message of that role and the per-row remainder as the final user message, so that every
+        request shares an identical prefix that providers can cache. Note that some chat
+        templates reject system messages or consecutive user messages.
+        """
+        content = prompt if rendered else self.make_prompt(prompt)
+        prefix = self.static_prefix.strip()
+        if self.prompt_layout == "single" or not prefix or not content.lstrip().startswith(prefix):
+            return [{"role": "user", "content": content}]
+
+        dynamic = content.lstrip()[len(prefix):].strip()
+        return [
+            {"role": self.prompt_layout, "content": self._static_content(prefix)},
+            {"role": "user", "content": dynamic},
+        ]
+
+    def _static_content(
+        self,
+        prefix: str,  # Static template prefix
+    ):
+        """
+        Content of the leading static message, with a cache-control hint when enabled.
+        """
+        if self.cache_control:
+            # Content-part form understood by OpenAI-compatible providers honoring cache breakpoints
+            return [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}]
+        return prefix
+
+    def render_prompts(
+        self,
+        data:pd.DataFrame|pd.Series,
+        column_map:dict=None,  # Template variable -> DataFrame column
+    ):
+        """
+        Renders the prompt template over whole columns in one vectorized pass.
+
+        Args:
+            data (pd.DataFrame | pd.Series): The rows to render. A Series fills the template's
+                single input variable; a DataFrame fills each variable from a column.
+            column_map (dict): Columns to use for the template variables, defaulting to the
+                columns named after the variables.
+
+        Returns:
+            pd.Series: The rendered prompts, with the index of `data`.
+
+        Raises:
+            ValueError: If a template variable has no matching column.
+        """
+        if isinstance(data, pd.Series):
+            if self.prompt_template is None:
+                return data.fillna("").astype(str)
+            if len(self.input_variables) != 1:
+                raise ValueError(f"Template expects several variables {self.input_variables}, pass a DataFrame.")
+            data = data.to_frame(name=self.input_variables[0])
+            column_map = None
+        elif self.prompt_template is None:
+            raise ValueError("No prompt template loaded: pass the text column as a Series.")
+
+        column_map = {v: v for v in self.input_variables} | (column_map or {})
+        missing = [v for v in self.input_variables if column_map[v] not in data.columns]
+        if missing:
+            raise ValueError(f"Template variables without a matching column: {missing}")
+
+        # Split the template once into literals and fields, then concatenate whole columns
+        rendered = pd.Series("", index=data.index, dtype=object)
+        for literal, field, format_spec, conversion in string.Formatter().parse(self.prompt_template):
+            if literal:
+                rendered = rendered + literal
+            if field is None:
+                continue
+            if field not in column_map or format_spec or conversion:
+                # Unusual fields (attribute access, format specs): fall back to row-wise rendering
+                columns = {v: data[column_map[v]].fillna("") for v in self.input_variables}
+                return pd.Series(
+                    [self.make_prompt(row) for row in pd.DataFrame(columns).to_dict("records")],
+                    index=data.index,
+                    dtype=object,
+                )
+            # Empty cells (None / NaN) render as empty strings
+            rendered = rendered + data[column_map[field]].fillna("").astype(str)
+        return rendered
+
     def load_prompt_template(
         self,
         yaml_template:str=None,
     ):
         if yaml_template is None:
             self.prompt_template = None
+            self.static_prefix = ""
         else:
-            # Load the YAML file
-            #with open(yaml_template, "r") as file:
-            yaml_template = yaml.safe_load(yaml_template)
+            # Parse the YAML content (cached by content hash in the template registry)
+            template = parse_template_content(yaml_template)
+            self.prompt_template = template["prompt_template"]
+            self.input_variables = list(template["input_variables"])
+            self.static_prefix = template["static_prefix"]
 
-            prompt_tmp = "\n".join([
-                yaml_template["prefix"], 
-                yaml_template["core_prompt"], 
-                yaml_template["suffix"]
-            ])
+        return
+
+# =============================================
+async def async_generate_batches(
+    prompters: list[Prompter],
+    prompts_lists: list[list],  # One list of prompts per prompter
+    batch_kwargs_list: list[dict] = None,  # Per-prompter arguments (e.g. batch_size, callbacks)
+    **kwargs,  # Arguments shared by every prompter
+):
+    """
+    Runs the batch engines of several prompters concurrently on one event loop.
 
-            self.prompt_template = prompt_tmp
+    Each prompter keeps its own sliding window (`batch_size`) and its own rate limiter,
+    so models hitting different providers proceed independently and the total wall time
+    tracks the slowest model rather than the sum.
 
-        return
+    Returns:
+        list: For each prompter, its list of responses, or the exception that aborted its batch.
+    """
+    if batch_kwargs_list is None:
+        batch_kwargs_list = [{} for _ in prompters]
+    return await asyncio.gather(
+        *[
+            p.async_generate_batch(prompts, **{**kwargs, **batch_kwargs})
+            for p, prompts, batch_kwargs in zip(prompters, prompts_lists, batch_kwargs_list)
+        ],
+        return_exceptions=True,
+    )
+
+def generate_batches(*args, **kwargs):
+    """
+    Synchronous wrapper of `async_generate_batches`.
+    """
+    return run_async(async_generate_batches(*args, **kwargs))
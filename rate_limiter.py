@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+
+# Rough characters-per-token ratio used to estimate prompt sizes without a tokenizer
+CHARS_PER_TOKEN = 4
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate` units per second.
+
+    Callers reserve units up front and are told how long to wait; the bucket may go
+    into debt so that concurrent callers are served in arrival order instead of racing.
+    """
+    def __init__(
+        self,
+        rate: float,  # Units added per second
+        capacity: float = None,  # Maximum burst size, defaults to one second worth of units
+    ):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def delay(self, amount: float = 1.0):
+        """
+        Returns how long a request of `amount` units would wait now, without reserving anything.
+        """
+        with self.lock:
+            level = min(self.capacity, self.level + (time.monotonic() - self.updated) * self.rate)
+            return max(0.0, (amount - level) / self.rate)
+
+    def reserve(self, amount: float = 1.0):
+        """
+        Takes `amount` units from the bucket and returns the delay (seconds) before they are available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.rate
+
+
+class RateLimiter:
+    """
+    Client-side limiter combining a requests-per-minute and a tokens-per-minute bucket.
+    Either limit may be None (unlimited).
+    """
+    def __init__(
+        self,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Burst capacity of one second of quota (at least one request) keeps traffic smooth
+        self.request_bucket = TokenBucket(requests_per_minute / 60) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute / 60) if tokens_per_minute else None
+
+    def _reserve(self, tokens: int = 0):
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None and tokens:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        return delay
+
+    def expected_delay(self, tokens: int = 0):
+        """
+        Returns how long a request of `tokens` estimated tokens would currently wait for quota.
+        """
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.delay(1))
+        if self.token_bucket is not None and tokens:
+            delay = max(delay, self.token_bucket.delay(tokens))
+        return delay
+
+    def acquire_sync(self, tokens: int = 0):
+        """
+        Blocks until one request of `tokens` estimated tokens fits within the limits.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Waits (without blocking the event loop) until one request of `tokens` estimated tokens fits within the limits.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return
+
+
+# Limiters shared by every Prompter targeting the same endpoint, token and limit scope
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+def resolve_rate_limits(rate_limits: dict, model_name: str = None):
+    """
+    Resolves the limits applying to a model from a `rate_limits` entry of `services.json`.
+
+    The entry holds service-wide `requests_per_minute` / `tokens_per_minute` values and an
+    optional `models` mapping overriding them for specific models.
+
+    Returns:
+        tuple: (limits dict, scope) where scope is the model name for model-specific limits, else None.
+    """
+    if not rate_limits:
+        return {}, None
+    limits = {k: v for k, v in rate_limits.items() if k != "models"}
+    model_limits = rate_limits.get("models", {}).get(model_name)
+    if model_limits:
+        limits.update(model_limits)
+        return limits, model_name
+    return limits, None
+
+def scale_rate_limits(rate_limits: dict, share: float):
+    """
+    Scales a `rate_limits` entry (service-wide and per-model quotas) by `share`, e.g. to split a
+    quota between worker processes.
+    """
+    if not rate_limits:
+        return rate_limits
+    scaled = {
+        k: v * share if isinstance(v, (int, float)) and v else v
+        for k, v in rate_limits.items() if k != "models"
+    }
+    if "models" in rate_limits:
+        scaled["models"] = {model: scale_rate_limits(limits, share) for model, limits in rate_limits["models"].items()}
+    return scaled
+
+def get_rate_limiter(
+    base_url: str,
+    token: str,
+    rate_limits: dict,
+    model_name: str = None,
+):
+    """
+    Returns the process-wide RateLimiter for an endpoint and token, or None when no limits apply.
+    Service-wide limits are shared across models; model-specific limits get their own limiter.
+    """
+    limits, scope = resolve_rate_limits(rate_limits, model_name)
+    if not limits.get("requests_per_minute") and not limits.get("tokens_per_minute"):
+        return None
+    key = (base_url, token, scope)
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if (
+            limiter is None
+            or limiter.requests_per_minute != limits.get("requests_per_minute")
+            or limiter.tokens_per_minute != limits.get("tokens_per_minute")
+        ):
+            limiter = RateLimiter(
+                requests_per_minute=limits.get("requests_per_minute"),
+                tokens_per_minute=limits.get("tokens_per_minute"),
+            )
+            _LIMITERS[key] = limiter
+    return limiter
+
+def estimate_tokens(prompt_dicts: list[dict], max_tokens: int = 0):
+    """
+    Estimates the tokens a request will consume: prompt characters over CHARS_PER_TOKEN plus the completion budget.
+    """
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in prompt_dicts)
+    return prompt_chars // CHARS_PER_TOKEN + 1 + int(max_tokens or 0)
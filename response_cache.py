@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = ".cache/responses.sqlite"
+
+class ResponseCache:
+    """
+    Persistent content-addressed cache of completions, stored in SQLite.
+
+    Entries are keyed by a hash of the request (endpoint, model, messages, generation args),
+    expire after `ttl` seconds and are evicted least-recently-used first once the stored
+    responses exceed `max_size_mb`.
+    """
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,  # SQLite file holding the cache
+        max_size_mb: float = 512,  # Size cap of the stored responses
+        ttl: float = 30 * 24 * 3600,  # Time-to-live of an entry, in seconds (None to keep forever)
+    ):
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        # Running size of the stored responses, so that writes don't scan the table
+        self.total_size = self._stored_size()
+
+    def __reduce__(self):
+        # Worker processes reopen the cache file instead of copying the connection
+        return (_open_cache, (self.path, self.max_size / (1024 * 1024), self.ttl))
+
+    @staticmethod
+    def make_key(
+        base_url: str,
+        model_name: str,
+        messages: list[dict],
+        generation_args: dict,
+    ):
+        """
+        Hashes the fields that determine a completion into a cache key.
+        """
+        payload = json.dumps(
+            [base_url, model_name, messages, generation_args],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the cached response for `key`, or None if missing or expired.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._delete(key)
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str):
+        """
+        Stores a response and evicts least-recently-used entries beyond the size cap.
+        """
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self.lock:
+            replaced = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self.total_size += size - (replaced[0] if replaced else 0)
+            if self.total_size > self.max_size:
+                self._evict()
+        return
+
+    def _stored_size(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _delete(self, key: str):
+        row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_size -= row[0]
+        return
+
+    def _evict(self):
+        # Other processes may share the file: resync the running total before evicting
+        self.total_size = self._stored_size()
+        if self.total_size <= self.max_size:
+            return
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            stale.append((key,))
+            self.total_size -= size
+            if self.total_size <= self.max_size:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        return
+
+    def clear(self):
+        """
+        Removes every cached response.
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.total_size = 0
+        return
+
+
+# Caches shared by every Prompter using the same file
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+def get_response_cache(path: str = DEFAULT_CACHE_PATH, **kwargs):
+    """
+    Returns the process-wide ResponseCache stored at `path`.
+    """
+    with _CACHES_LOCK:
+        if path not in _CACHES:
+            _CACHES[path] = ResponseCache(path, **kwargs)
+        return _CACHES[path]
+
+def _open_cache(path: str, max_size_mb: float, ttl: float):
+    return get_response_cache(path, max_size_mb=max_size_mb, ttl=ttl)
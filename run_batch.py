@@ -0,0 +1,248 @@
+"""
+Headless batch runner: completes a CSV file with one or more models from the command line.
+
+Example:
+    HF_API_TOKEN=... python run_batch.py data.csv --text-column text \\
+        --template newspaper_en.yaml --model google/gemma-2-9b-it --batch-size 32
+
+API tokens are read from the environment, following the app's naming: `HF_API_TOKEN` for
+the `API:HF` service, `OR_API_TOKEN` for `API:OR`, or the variable given with `--token-env`.
+With `--pool`, each model is served by every service listing it and having a token set, the
+requests being balanced across them with failover (see `pool.PrompterPool`).
+Completions are journaled as they arrive, so an interrupted job resumes where it stopped.
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+import pandas as pd
+
+from prompter import Prompter, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from pool import PrompterPool, canonical_model_name
+from hedging import HedgePolicy
+from utils import read_json
+from csv_pipeline import complete_csv, DEFAULT_CHUNKSIZE
+from sharding import sharded_complete_csv
+from journal import get_journal, make_file_job_id
+from response_cache import get_response_cache
+from batch_api import MAX_BATCH_REQUESTS, DEFAULT_POLL_INTERVAL
+
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SERVICES_PATH = os.path.join(APP_FOLDER, "params", "services.json")
+GEN_ARGS_PATH = os.path.join(APP_FOLDER, "params", "gen_args.json")
+TEMPLATES_FOLDER = os.path.join(APP_FOLDER, "templates")
+
+class ProgressReporter:
+    """
+    Prints a live throughput / ETA line to stderr.
+    """
+    def __init__(
+        self,
+        total_rows: int,
+        num_models: int,
+        refresh: float = 0.5,  # Minimum delay between two refreshes, in seconds
+    ):
+        self.total_rows = total_rows
+        self.num_models = num_models
+        self.refresh = refresh
+        self.start = time.monotonic()
+        self.last_print = 0.0
+        self.completions = 0
+        self.errors = 0
+        self.rows_written = 0
+
+    def on_result(self, row, model_name, completion):
+        self.completions += 1
+        self.print()
+
+    def on_error(self, row, message):
+        self.errors += 1
+        print(f"\nRow {row}: {message}", file=sys.stderr)
+        self.print()
+
+    def on_rows(self, rows_written):
+        self.rows_written = rows_written
+        self.print(force=True)
+
+    def print(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_print < self.refresh:
+            return
+        self.last_print = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.completions / elapsed
+        remaining = max(self.total_rows - self.rows_written, 0) * self.num_models
+        eta = f"{remaining / rate:,.0f}s" if rate > 0 else "?"
+        print(
+            f"\r{self.completions:,} completions | {rate:,.1f} req/s | {self.errors:,} errors"
+            f" | rows {self.rows_written:,}/~{self.total_rows:,} | elapsed {elapsed:,.0f}s | ETA {eta}   ",
+            end="",
+            file=sys.stderr,
+            flush=True,
+        )
+        return
+
+def count_rows(path: str):
+    """
+    Approximate number of data rows of a CSV (line count minus header), used for the ETA.
+    """
+    with open(path, "rb") as file:
+        return max(sum(1 for _ in file) - 1, 0)
+
+def resolve_template(template: str):
+    """
+    Returns the YAML content of a template given as a path or as a file name in the templates folder.
+    """
+    path = template if os.path.exists(template) else os.path.join(TEMPLATES_FOLDER, template)
+    with open(path, "r") as file:
+        return file.read()
+
+def make_alternate(services: dict, service_key: str, model_name: str):
+    """
+    Prompter for the same model on another service of services.json, receiving hedged requests.
+    """
+    service = services[service_key]
+    token_name = service_key.split(":")[1] + "_API_TOKEN"
+    if not os.environ.get(token_name):
+        sys.exit(f"Missing API token: set the {token_name} environment variable.")
+    matches = [m for m in service["available_models"] if canonical_model_name(m) == canonical_model_name(model_name)]
+    if not matches:
+        sys.exit(f"{service['name']} doesn't serve {model_name}.")
+    alternate = Prompter(base_url=service["base_url"])
+    alternate._set_token(os.environ[token_name])
+    alternate._set_model(matches[0])
+    alternate._set_rate_limits(service.get("rate_limits"))
+    return alternate
+
+def build_parser(gen_args: dict):
+    parser = argparse.ArgumentParser(description="Complete a CSV file with LLM APIs, without the Streamlit app.")
+    parser.add_argument("input", help="Input CSV file.")
+    parser.add_argument("--text-column", required=True, help="Column holding the text inserted in the prompt.")
+    parser.add_argument("--template", default=None, help="YAML prompt template (path or file name in templates/).")
+    parser.add_argument("--model", "-m", action="append", required=True, help="Model name; repeat to compare models.")
+    parser.add_argument("--service", default="API:HF", help="Service key in services.json (default: API:HF).")
+    parser.add_argument("--base-url", default=None, help="Custom endpoint URL, overrides --service.")
+    parser.add_argument("--token-env", default=None, help="Environment variable holding the API token.")
+    parser.add_argument("--pool", action="store_true", help="Balance each model over all services serving it, with failover.")
+    parser.add_argument("--output", "-o", default=None, help="Output CSV (default: <input>_completed.csv).")
+    parser.add_argument("--hedge", type=float, default=None, metavar="PERCENTILE", help="Duplicate requests slower than this latency percentile (e.g. 95).")
+    parser.add_argument("--hedge-budget", type=float, default=0.05, help="Share of requests that may be duplicated (default: 0.05).")
+    parser.add_argument("--hedge-service", default=None, help="Service key in services.json receiving the duplicates (default: same endpoint).")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT, help="Seconds to establish a connection.")
+    parser.add_argument("--read-timeout", type=float, default=DEFAULT_READ_TIMEOUT, help="Seconds without data from the server before a request fails.")
+    parser.add_argument("--deadline", type=float, default=None, help="Stop the job after this many seconds, keeping the rows completed so far.")
+    parser.add_argument("--backend", choices=["chat", "batch"], default="chat", help="'batch' submits the job to the provider's offline batch API (/v1/files + /v1/batches).")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between status checks of submitted batches.")
+    parser.add_argument("--batch-size", type=int, default=16, help="Initial requests in flight per model; the limit then adapts to the endpoint's capacity.")
+    parser.add_argument("--max-retries", type=int, default=3, help="Retries per failed prompt.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing the job, each with its share of --batch-size and of the rate limits.")
+    parser.add_argument("--chunksize", type=int, default=None, help=f"CSV rows processed at a time (default: {DEFAULT_CHUNKSIZE}, or {MAX_BATCH_REQUESTS} with the batch backend).")
+    parser.add_argument("--prompt-layout", choices=["single", "system", "user"], default="single", help="Send the static template prefix as a separate leading message.")
+    parser.add_argument("--cache", action="store_true", help="Use the on-disk response cache.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the job plan (requests, tokens, ETA).")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore completions journaled by previous runs.")
+    # Generation parameters, with the app's defaults
+    for k, v in gen_args.items():
+        parser.add_argument(f"--{k.replace('_', '-')}", dest=k, type=type(v["default"]), default=v["default"], help=v["name"])
+    return parser
+
+def main(argv=None):
+    services = read_json(SERVICES_PATH)
+    gen_args = read_json(GEN_ARGS_PATH)
+    args = build_parser(gen_args).parse_args(argv)
+    # Options of the live chat backend
+    if args.backend == "batch":
+        for option, enabled in [("--processes", args.processes > 1), ("--pool", args.pool), ("--hedge", args.hedge is not None)]:
+            if enabled:
+                sys.exit(f"{option} only applies to the chat backend.")
+
+    # Endpoint, rate limits and token
+    if args.pool:
+        tokens = {key: os.environ.get(key.split(":")[1] + "_API_TOKEN") for key in services}
+        if not any(tokens.values()):
+            sys.exit("Missing API tokens: set the <SERVICE>_API_TOKEN environment variables of the pooled services.")
+        token_name = None
+    elif args.base_url:
+        base_url, rate_limits, cache_control = args.base_url, None, False
+        token_name = args.token_env
+    else:
+        service = services[args.service]
+        base_url, rate_limits = service["base_url"], service.get("rate_limits")
+        cache_control = service.get("cache_control", False)
+        token_name = args.token_env or args.service.split(":")[1] + "_API_TOKEN"
+    token = os.environ.get(token_name) if token_name else None
+    if token_name and not token:
+        sys.exit(f"Missing API token: set the {token_name} environment variable.")
+
+    template = resolve_template(args.template) if args.template else None
+    prompters = []
+    for model_name in args.model:
+        if args.pool:
+            prompter = PrompterPool.from_services(services, model_name, tokens)
+            if not prompter.endpoints:
+                sys.exit(f"No service with a token serves {model_name}.")
+        else:
+            prompter = Prompter(base_url=base_url)
+            prompter._set_token(token)
+            prompter._set_model(model_name)
+            prompter._set_rate_limits(rate_limits)
+            # Pools follow the cache-control support of each of their providers
+            prompter._set_cache_control(cache_control)
+        prompter._set_generation_args({k: getattr(args, k) for k in gen_args})
+        prompter.load_prompt_template(template)
+        prompter._set_prompt_layout(args.prompt_layout)
+        prompter._set_timeouts(connect=args.connect_timeout, read=args.read_timeout)
+        if args.cache:
+            prompter._set_cache(get_response_cache())
+        if args.hedge is not None:
+            alternate = None
+            if args.hedge_service:
+                alternate = make_alternate(services, args.hedge_service, model_name)
+                alternate._set_generation_args(prompter.generation_args)
+                alternate._set_timeouts(connect=args.connect_timeout, read=args.read_timeout)
+                if args.cache:
+                    alternate._set_cache(get_response_cache())
+            prompter._set_hedging(HedgePolicy(quantile=args.hedge, budget=args.hedge_budget, alternate=alternate))
+        prompters.append(prompter)
+
+    if args.dry_run:
+        # Render the prompts of the text column only and plan each model's share of the job
+        texts = pd.read_csv(args.input, usecols=[args.text_column])[args.text_column]
+        for prompter in prompters:
+            plan = prompter.plan_batch(prompter.render_prompts(texts), batch_size=args.batch_size, rendered=True)
+            print(json.dumps(plan, indent=2))
+            if plan["token_count"] == "estimate":
+                print(f"Token counts of {plan['model']} are estimated from the text length (tokenizer unavailable, set HF_TOKEN for gated models).", file=sys.stderr)
+        return
+
+    journal = get_journal(make_file_job_id(args.input, prompters[0].prompt_template))
+    if args.no_resume:
+        journal.clear()
+
+    output = args.output or os.path.splitext(args.input)[0] + "_completed.csv"
+    reporter = ProgressReporter(count_rows(args.input), len(prompters))
+    run = complete_csv if args.processes <= 1 else functools.partial(sharded_complete_csv, processes=args.processes)
+    rows = run(
+        prompters=prompters,
+        input_file=args.input,
+        output_path=output,
+        text_column=args.text_column,
+        completion_columns=[f"{m}_completion" for m in args.model],
+        chunksize=args.chunksize or (MAX_BATCH_REQUESTS if args.backend == "batch" else DEFAULT_CHUNKSIZE),
+        progress_callback=reporter.on_rows,
+        error_callback=reporter.on_error,
+        result_callback=reporter.on_result,
+        journal=journal,
+        deadline=args.deadline,
+        batch_size=args.batch_size,
+        max_retries=args.max_retries,
+        backend=args.backend,
+        poll_interval=args.poll_interval,
+    )
+    print(f"\n{rows:,} rows written to {output}", file=sys.stderr)
+    return
+
+if __name__ == "__main__":
+    main()
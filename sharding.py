@@ -0,0 +1,244 @@
+import asyncio
+import collections
+import multiprocessing
+import os
+import queue
+import pandas as pd
+
+from prompter import Prompter, run_async, DEFAULT_POOL_SIZE
+from csv_pipeline import _complete_chunk, _fill_missing_completions, restore_from_journal, DEFAULT_CHUNKSIZE
+from concurrency import CancelToken
+
+# Default `batch_size` of `Prompter.async_generate_batch`, split between the processes
+DEFAULT_BATCH_SIZE = 16
+# Shards queued per process, so that workers never wait for the next one
+SHARDS_AHEAD = 2
+
+# Stop signal shared by the parent and the worker processes, set in each worker by `_init_worker`
+_CANCEL_EVENT = None
+# Queue carrying completions and errors back to the parent as they arrive, set by `_init_worker`
+_EVENTS = None
+
+def _init_worker(cancel_event, events=None):
+    global _CANCEL_EVENT, _EVENTS
+    _CANCEL_EVENT = cancel_event
+    _EVENTS = events
+    return
+
+def _worker_token():
+    return CancelToken(event=_CANCEL_EVENT)
+
+def _shard_batch_kwargs(
+    batch_kwargs: dict,
+    processes: int,
+):
+    """
+    Splits the concurrency budget of a job (`batch_size`, `max_concurrency`) between the processes.
+    """
+    kwargs = dict(batch_kwargs)
+    kwargs["batch_size"] = max(1, (kwargs.get("batch_size") or DEFAULT_BATCH_SIZE) // processes)
+    kwargs["max_concurrency"] = max(1, (kwargs.get("max_concurrency") or DEFAULT_POOL_SIZE) // processes)
+    return kwargs
+
+def _ordered_map(
+    pool,
+    fn,
+    tasks,  # Iterable of arguments of `fn`, consumed lazily
+    window: int,  # Maximum number of tasks submitted and not yet merged
+    cancel_token: CancelToken = None,
+    cancel_event=None,  # Event set to stop the workers once the token is cancelled
+    wait=None,  # Called with a timeout instead of sleeping while the oldest task runs
+):
+    """
+    Runs `fn` on the tasks in a process pool and yields the results in submission order, with a
+    bounded number of tasks in flight. Once the token is cancelled no new task is submitted, the
+    workers are told to stop and the results of the tasks already submitted are still yielded.
+    """
+    tasks = iter(tasks)
+    pending = collections.deque()
+    exhausted = False
+    while True:
+        cancelled = cancel_token is not None and cancel_token.cancelled
+        if cancelled:
+            cancel_event.set()
+        while not exhausted and not cancelled and len(pending) < window:
+            task = next(tasks, None)
+            if task is None:
+                exhausted = True
+            else:
+                pending.append(pool.apply_async(fn, (task,)))
+        if not pending:
+            return
+        if not pending[0].ready():
+            if wait is None:
+                pending[0].wait(0.1)
+            else:
+                wait(0.1)
+            continue
+        yield pending.popleft().get()
+
+def _generate_shard(args):
+    prompter, prompts, batch_kwargs = args
+    errors = []
+    results = prompter.generate_batch(
+        prompts,
+        error_callback=lambda i, message: errors.append((i, message)),
+        cancel_token=_worker_token(),
+        **batch_kwargs,
+    )
+    return results, errors
+
+def sharded_generate_batch(
+    prompter: Prompter,
+    prompts: list,
+    processes: int = None,  # Worker processes, defaults to the number of CPUs
+    shard_size: int = DEFAULT_CHUNKSIZE,  # Prompts per shard
+    error_callback=None,  # Called with (index, error message) for failed prompts
+    result_callback=None,  # Called with (index, response) as shards complete
+    deadline: float = None,  # Time budget of the job, in seconds
+    cancel_token: CancelToken = None,
+    **batch_kwargs,  # Forwarded to Prompter.generate_batch in every worker
+):
+    """
+    `Prompter.generate_batch` spread over worker processes.
+
+    Prompts are cut into shards of `shard_size`, each completed by the async batch engine of a
+    worker process under an equal share of the concurrency (`batch_size`, `max_concurrency`) and
+    of the rate limits, so that prompt rendering and response decoding use every core. Results
+    are merged back in input order; callbacks are called from this process as shards complete.
+
+    Returns:
+        list: The responses in input order. Failed prompts, and prompts not completed before a
+            stop, are left empty.
+    """
+    processes = processes or os.cpu_count()
+    if deadline is not None:
+        cancel_token = CancelToken(deadline=deadline, parent=cancel_token)
+    shard_prompter = prompter._budget_share(1 / processes)
+    kwargs = _shard_batch_kwargs(batch_kwargs, processes)
+    shards = (
+        (shard_prompter, prompts[start:start + shard_size], kwargs)
+        for start in range(0, len(prompts), shard_size)
+    )
+    results = []
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    with context.Pool(processes, initializer=_init_worker, initargs=(cancel_event,)) as pool:
+        for shard_results, errors in _ordered_map(pool, _generate_shard, shards, processes * SHARDS_AHEAD, cancel_token, cancel_event):
+            offset = len(results)
+            results.extend(shard_results)
+            if error_callback:
+                for i, message in errors:
+                    error_callback(offset + i, message)
+            if result_callback:
+                for i, response in enumerate(shard_results):
+                    if response:
+                        result_callback(offset + i, response)
+    # Shards never submitted after a stop
+    results.extend([""] * (len(prompts) - len(results)))
+    return results
+
+def _complete_csv_shard(args):
+    shard_number, prompters, chunk, text_column, completion_columns, batch_kwargs = args
+    async def complete():
+        # Every model completes its missing rows of the shard concurrently
+        await asyncio.gather(*[
+            _complete_chunk(
+                chunk, prompter, text_column, completion_column, {}, None,
+                lambda row, message: _EVENTS.put(("error", row, message)),
+                lambda row, model_name, completion: _EVENTS.put(("result", row, model_name, completion)),
+                {**batch_kwargs, "cancel_token": _worker_token()},
+            )
+            for prompter, completion_column in zip(prompters, completion_columns)
+        ])
+    try:
+        run_async(complete())
+    finally:
+        # Queued after the shard's completions, which the parent then knows it has all received
+        _EVENTS.put(("done", shard_number))
+    return shard_number, chunk.to_csv(header=shard_number == 0, index=False), len(chunk)
+
+def sharded_complete_csv(
+    prompters: list[Prompter],
+    input_file,  # Path or file-like object of the input CSV
+    output_path: str,  # Path of the completed CSV written incrementally
+    text_column: str,
+    completion_columns: list[str],
+    processes: int = None,  # Worker processes, defaults to the number of CPUs
+    chunksize: int = DEFAULT_CHUNKSIZE,  # Rows per shard
+    progress_callback=None,  # Called with the number of rows written so far
+    error_callback=None,  # Called with (row index, error message) for failed rows
+    journal=None,  # Optional CompletionJournal to resume from and record into
+    result_callback=None,  # Called with (row index, model name, completion) for each new completion
+    deadline: float = None,  # Time budget of the whole job, in seconds
+    cancel_token: CancelToken = None,  # Stops the job when cancelled
+    **batch_kwargs,  # Forwarded to Prompter.async_generate_batch in every worker
+):
+    """
+    `csv_pipeline.complete_csv` spread over worker processes.
+
+    This process reads the CSV chunk by chunk and restores journaled completions; each chunk is
+    then a shard completed by a worker process (prompt rendering, requests, response decoding,
+    DataFrame updates and CSV serialization) under an equal share of the concurrency and rate
+    limits. Completions and errors are sent back to this process as they arrive, to be journaled
+    and reported right away, and shards are written back in input order. On a stop, the shards
+    already submitted are written with the completions received so far.
+
+    Returns:
+        int: The number of rows written.
+    """
+    processes = processes or os.cpu_count()
+    if deadline is not None:
+        cancel_token = CancelToken(deadline=deadline, parent=cancel_token)
+    journaled = [journal.completed(p.model_name) if journal else {} for p in prompters]
+    shard_prompters = [p._budget_share(1 / processes) for p in prompters]
+    kwargs = _shard_batch_kwargs(batch_kwargs, processes)
+
+    def shards():
+        for chunk_number, chunk in enumerate(pd.read_csv(input_file, chunksize=chunksize)):
+            for completion_column, done in zip(completion_columns, journaled):
+                missing = _fill_missing_completions(chunk, completion_column)
+                restore_from_journal(chunk, completion_column, missing, done)
+            yield chunk_number, shard_prompters, chunk, text_column, completion_columns, kwargs
+
+    finished = set()  # Shards whose completions have all been received
+    def handle(event):
+        kind, *fields = event
+        if kind == "result":
+            row, model_name, completion = fields
+            if journal:
+                journal.record(row, model_name, completion)
+            if result_callback:
+                result_callback(row, model_name, completion)
+        elif kind == "error":
+            if error_callback:
+                error_callback(*fields)
+        else:
+            finished.add(fields[0])
+        return
+
+    def drain(timeout: float):
+        try:
+            event = events.get(timeout=timeout)
+            while True:
+                handle(event)
+                event = events.get_nowait()
+        except queue.Empty:
+            pass
+        return
+
+    rows_done = 0
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    events = context.Queue()
+    with context.Pool(processes, initializer=_init_worker, initargs=(cancel_event, events)) as pool, \
+            open(output_path, "w", newline="", encoding="utf-8") as output:
+        for shard_number, csv_text, rows in _ordered_map(pool, _complete_csv_shard, shards(), processes * SHARDS_AHEAD, cancel_token, cancel_event, wait=drain):
+            while shard_number not in finished:
+                drain(0.1)
+            output.write(csv_text)
+            output.flush()
+            rows_done += rows
+            if progress_callback:
+                progress_callback(rows_done)
+    return rows_done
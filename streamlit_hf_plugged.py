@@ -9,12 +9,21 @@ from app_config import *
 from features.chat_mode import *
 from features.csv_mode import *
 from features.multimodels import *
+from features.metrics_panel import *
+from metrics import start_metrics_server
 
 float_init(theme=True, include_unstable_primary=False)
 
 SERVICES = read_json("params/services.json")
 DEFAULT_GEN_ARGS = read_json("params/gen_args.json")
 
+# Async requests of every session run on one long-lived event loop, keeping connections alive
+set_async_runner(get_async_runner())
+
+# Optional Prometheus endpoint (e.g. METRICS_PORT=9100), local only unless METRICS_HOST is set
+if os.environ.get("METRICS_PORT"):
+    start_metrics_server(int(os.environ["METRICS_PORT"]), os.environ.get("METRICS_HOST", "127.0.0.1"))
+
 
 def clear_conversation():
     st.session_state.messages = []
@@ -27,13 +36,13 @@ def main():
     # Ensure the title is displayed on every re-render
     st.title("LLMs APIs Interactions")  # Persistent title
 
-    # Initialize prompter
-    prompter = Prompter()
+    # Collect the configuration, the session's prompter is resolved once it is complete
+    config = Prompter()
 
     # Configure sidebar
     with st.sidebar:
         configure_api(
-            prompter = prompter,
+            prompter = config,
             services_dict = SERVICES,
             generation_args = DEFAULT_GEN_ARGS
         )
@@ -51,13 +60,14 @@ def main():
 
     if selected_model:
         try:
-            prompter._set_model(selected_model)
+            config._set_model(selected_model)
             st.success(f"Model set to: {selected_model}")
         except Exception as e:
             st.error(f"Failed to set model: {e}")
+    prompter = session_prompter(config)
 
     # Tabs for mode selection
-    tab1, tab2, tab3 = st.tabs(["Chat with Model", "Upload CSV for Completion", "🚧 Compare Models"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Chat with Model", "Upload CSV for Completion", "🚧 Compare Models", "📊 Metrics"])
     with tab1:
         #chat_mode(prompter)
         chat_mode(
@@ -75,10 +85,20 @@ def main():
             yaml_upload_key="yaml_upload",
             select_template_key="template_selection",
             select_column_key="column_to_complete",
-            download_completed_key="download_completed"
+            download_completed_key="download_completed",
+            use_cache_key="use_cache",
+            large_file_key="large_file_mode",
+            discard_journal_key="discard_journal",
+            prompt_layout_key="prompt_layout",
+            plan_job_key="plan_job",
+            stop_job_key="stop_job",
+            deadline_key="job_deadline",
+            backend_key="request_backend",
         )
     with tab3:
         multimodels_compare()
+    with tab4:
+        metrics_panel()
 
 
 if __name__ == "__main__":
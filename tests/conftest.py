@@ -0,0 +1,91 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from aiohttp import web
+
+from mock_server import make_app
+
+class MockServer:
+    """
+    The benchmarks' mock endpoint, served from a background event loop on a free port.
+    """
+    def __init__(self, **kwargs):
+        self.app = make_app(**kwargs)
+        self.loop = asyncio.new_event_loop()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.runner = web.AppRunner(self.app)
+        self.loop.run_until_complete(self.runner.setup())
+        self.loop.run_until_complete(web.TCPSite(self.runner, "127.0.0.1", self.port).start())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/v1/chat/completions"
+
+    @property
+    def stats(self):
+        return requests.get(f"http://127.0.0.1:{self.port}/stats").json()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+@pytest.fixture
+def mock_server():
+    """
+    Factory starting mock servers with `make_app` options, stopped at the end of the test.
+    """
+    servers = []
+    def start(**kwargs):
+        kwargs.setdefault("latency_median", 0.01)
+        kwargs.setdefault("latency_sigma", 0)
+        kwargs.setdefault("echo", True)
+        kwargs.setdefault("completion_words", 0)
+        server = MockServer(**kwargs)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
+
+@pytest.fixture
+def make_prompter():
+    """
+    Factory of Prompters bound to a mock server, with a model name unique to the test so that
+    process-wide state (limits, metrics) doesn't leak between tests.
+    """
+    from prompter import Prompter
+    counter = iter(range(1000))
+    def make(server, token="token", model_name=None, **generation_args):
+        prompter = Prompter(base_url=server.url)
+        prompter._set_token(token)
+        prompter._set_model(model_name or f"model-{os.urandom(4).hex()}-{next(counter)}")
+        prompter._set_generation_args(generation_args)
+        return prompter
+    return make
+
+@pytest.fixture
+def async_runner():
+    """
+    A shared event loop set as the process-wide async runner for the test.
+    """
+    from prompter import AsyncRunner, set_async_runner
+    runner = AsyncRunner()
+    set_async_runner(runner)
+    yield runner
+    set_async_runner(None)
+    runner.close()
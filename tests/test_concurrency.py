@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from concurrency import AdaptiveConcurrency, BackgroundJob
+
+def test_background_job_records_its_result():
+    job = BackgroundJob(lambda job: 42)
+    job.thread.join()
+    assert job.done and job.result == 42 and job.error is None
+
+def test_background_job_records_cancellation_as_an_error():
+    def cancelled(job):
+        raise asyncio.CancelledError()
+    job = BackgroundJob(cancelled)
+    job.thread.join()
+    assert job.result is None
+    assert isinstance(job.error, asyncio.CancelledError)
+
+def test_background_job_stops_on_deadline():
+    def wait_for_stop(job):
+        while not job.token.cancelled:
+            time.sleep(0.01)
+        return job.token.reason
+    job = BackgroundJob(wait_for_stop, deadline=0.05)
+    job.thread.join(timeout=5)
+    assert job.done and job.result is not None
+
+def test_adaptive_limit_ignores_single_slow_responses():
+    controller = AdaptiveConcurrency(initial=16)
+    for i in range(320):
+        controller.on_success(5.0 if i % 10 == 0 else 0.1)
+    assert controller.current > 16
+
+def test_adaptive_limit_decreases_on_sustained_latency_rise():
+    controller = AdaptiveConcurrency(initial=16)
+    for _ in range(64):
+        controller.on_success(0.1)
+    grown = controller.limit
+    for _ in range(32):
+        controller.on_success(0.5)
+    assert controller.limit < grown / 1.5
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+
+import pandas as pd
+
+import csv_pipeline
+from csv_pipeline import complete_csv
+from concurrency import get_last_limit, set_last_limit
+from response_cache import ResponseCache
+from prompter import run_async
+
+def test_generate_batch_keeps_input_order(mock_server, make_prompter):
+    server = mock_server(latency_sigma=0.5)
+    prompter = make_prompter(server, temperature=1.0)
+    prompts = [f"prompt {i}" for i in range(40)]
+    assert prompter.generate_batch(prompts, batch_size=8) == prompts
+    assert server.stats["requests"] == 40
+
+def test_generate_batch_retries_rate_limits(mock_server, make_prompter):
+    server = mock_server(rate_429=0.3, retry_after=0.01)
+    prompter = make_prompter(server, temperature=1.0)
+    prompts = [f"prompt {i}" for i in range(20)]
+    assert prompter.generate_batch(prompts, max_retries=10) == prompts
+    assert server.stats["errors"] > 0
+
+def test_generate_batch_reports_errors(mock_server, make_prompter):
+    server = mock_server(tokens=["good"])
+    prompter = make_prompter(server, token="bad", temperature=1.0)
+    errors = {}
+    results = prompter.generate_batch(["a", "b"], error_callback=errors.__setitem__)
+    assert results == ["", ""]
+    assert sorted(errors) == [0, 1]
+    assert "401" in errors[0]
+
+def test_deterministic_prompts_are_sent_once(mock_server, make_prompter):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=0)
+    prompts = ["same", "other", "same", "same"]
+    assert prompter.generate_batch(prompts) == prompts
+    assert server.stats["requests"] == 2
+
+TWO_VARIABLES_TEMPLATE = """
+input_variables: ["title", "author"]
+prefix: "Book:"
+core_prompt: "{title} by {author}"
+suffix: ""
+"""
+
+def test_deterministic_dict_rows_are_grouped(mock_server, make_prompter):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=0)
+    prompter.load_prompt_template(TWO_VARIABLES_TEMPLATE)
+    rows = [{"title": "A", "author": "X"}, {"title": "B", "author": "Y"}, {"title": "A", "author": "X"}]
+    results = prompter.generate_batch(rows)
+    assert [r.strip() for r in results] == ["Book:\nA by X", "Book:\nB by Y", "Book:\nA by X"]
+    assert server.stats["requests"] == 2
+
+def test_batch_backend_groups_dict_rows(mock_server, make_prompter):
+    server = mock_server(batch_duration=0.1)
+    prompter = make_prompter(server, temperature=0)
+    prompter.load_prompt_template(TWO_VARIABLES_TEMPLATE)
+    rows = [{"title": "A", "author": "X"}, {"title": "A", "author": "X"}]
+    results = prompter.generate_batch(rows, backend="batch", poll_interval=0.05)
+    assert results[0] == results[1] != ""
+    assert server.stats["batches"] == 1
+
+def test_batch_backend_fails_malformed_rows_only(mock_server, make_prompter):
+    server = mock_server(batch_duration=0.1)
+    for temperature in (0, 1.0):
+        prompter = make_prompter(server, temperature=temperature)
+        prompter.load_prompt_template(TWO_VARIABLES_TEMPLATE)
+        errors = {}
+        rows = [{"title": "A", "author": "X"}, {"title": "B"}]
+        results = prompter.generate_batch(rows, backend="batch", poll_interval=0.05, error_callback=errors.__setitem__)
+        assert results[0] != "" and results[1] == ""
+        assert list(errors) == [1]
+
+def test_concurrent_identical_requests_are_coalesced(mock_server, make_prompter):
+    server = mock_server(latency_median=0.2)
+    first = make_prompter(server, temperature=0)
+    second = make_prompter(server, model_name=first.model_name, temperature=0)
+
+    async def main():
+        return await asyncio.gather(
+            first.async_generate_batch(["shared"]),
+            second.async_generate_batch(["shared"]),
+        )
+
+    assert run_async(main()) == [["shared"], ["shared"]]
+    assert server.stats["requests"] == 1
+
+def test_requests_with_different_tokens_are_not_coalesced(mock_server, make_prompter):
+    server = mock_server(latency_median=0.2, tokens=["good"])
+    rejected = make_prompter(server, token="bad", temperature=0)
+    accepted = make_prompter(server, token="good", model_name=rejected.model_name, temperature=0)
+    errors = {}
+
+    async def main():
+        return await asyncio.gather(
+            rejected.async_generate_batch(["shared"], error_callback=errors.__setitem__),
+            accepted.async_generate_batch(["shared"]),
+        )
+
+    assert run_async(main()) == [[""], ["shared"]]
+    assert "401" in errors[0]
+    assert server.stats["requests"] == 2
+
+def test_cancelled_leader_doesnt_fail_followers(mock_server, make_prompter):
+    server = mock_server(latency_median=0.5)
+    leader = make_prompter(server, temperature=0)
+    follower = make_prompter(server, model_name=leader.model_name, temperature=0)
+
+    async def follow():
+        await asyncio.sleep(0.05)  # Let the leader send the request first
+        return await follower.async_generate_batch(["shared", "other"])
+
+    async def main():
+        return await asyncio.gather(leader.async_generate_batch(["shared"], deadline=0.2), follow())
+
+    assert run_async(main()) == [[""], ["shared", "other"]]
+    assert server.stats["requests"] == 3
+
+def test_cache_hits_dont_feed_the_adaptive_limit(mock_server, make_prompter, tmp_path):
+    server = mock_server(latency_median=0.05)
+    prompter = make_prompter(server, temperature=0)
+    prompter._set_cache(ResponseCache(str(tmp_path / "cache.sqlite")))
+    cached = [f"cached {i}" for i in range(200)]
+    prompter.generate_batch(cached, batch_size=64)
+    set_last_limit(prompter.base_url, prompter.model_name, 64)
+    # Cache hits answer in no time: counted as latencies, they would make the new requests look like spikes
+    fresh = [f"fresh {i}" for i in range(64)]
+    assert prompter.generate_batch(cached + fresh, batch_size=64) == cached + fresh
+    assert get_last_limit(prompter.base_url, prompter.model_name, None) >= 64
+
+def test_adaptive_limit_grows_despite_latency_variance(mock_server, make_prompter):
+    # Unlimited capacity: single slow responses are noise, not congestion
+    server = mock_server(latency_median=0.05, latency_sigma=1.0)
+    prompter = make_prompter(server, temperature=1.0)
+    prompts = [f"prompt {i}" for i in range(800)]
+    assert prompter.generate_batch(prompts, batch_size=16) == prompts
+    assert get_last_limit(prompter.base_url, prompter.model_name, None) > 16
+
+def test_complete_csv(mock_server, make_prompter, tmp_path):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=1.0)
+    input_path = tmp_path / "input.csv"
+    output_path = tmp_path / "output.csv"
+    pd.DataFrame({"text": [f"row {i}" for i in range(25)]}).to_csv(input_path, index=False)
+    rows = complete_csv([prompter], input_path, output_path, "text", ["completion"], chunksize=10)
+    assert rows == 25
+    output = pd.read_csv(output_path)
+    assert list(output["completion"]) == list(output["text"])
+
+def test_complete_csv_keeps_disk_io_off_the_shared_loop(mock_server, make_prompter, async_runner, tmp_path, monkeypatch):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=0)
+    writers = []
+    write_chunk = csv_pipeline._write_chunk
+    def record_thread(*args):
+        writers.append(threading.current_thread())
+        return write_chunk(*args)
+    monkeypatch.setattr(csv_pipeline, "_write_chunk", record_thread)
+    input_path = tmp_path / "input.csv"
+    output_path = tmp_path / "output.csv"
+    pd.DataFrame({"text": [f"row {i}" for i in range(25)]}).to_csv(input_path, index=False)
+    assert complete_csv([prompter], input_path, output_path, "text", ["completion"], chunksize=10) == 25
+    assert len(writers) == 3
+    assert async_runner.thread not in writers
+    assert list(pd.read_csv(output_path)["completion"]) == [f"row {i}" for i in range(25)]
+
+def test_empty_cells_render_as_empty_strings(mock_server, make_prompter, tmp_path):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=1.0)
+    prompter.load_prompt_template(TWO_VARIABLES_TEMPLATE.replace('["title", "author"]', '["text"]').replace("{title} by {author}", "Title: {text}"))
+    prompter._set_prompt_layout("system")
+    input_path = tmp_path / "input.csv"
+    output_path = tmp_path / "output.csv"
+    pd.DataFrame({"text": ["A", None, "C"]}).to_csv(input_path, index=False)
+    errors = {}
+    complete_csv([prompter], input_path, output_path, "text", ["completion"], error_callback=errors.__setitem__)
+    assert errors == {}
+    # Only the last message is echoed: the row remainder after the static prefix
+    assert list(pd.read_csv(output_path, keep_default_na=False)["completion"]) == ["A", "", "C"]
+
+def test_malformed_prompt_only_fails_its_row(mock_server, make_prompter):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=1.0)
+    prompter.load_prompt_template(TWO_VARIABLES_TEMPLATE.replace('["title", "author"]', '["text"]').replace("{title} by {author}", "{text}"))
+    prompter._set_prompt_layout("system")
+    errors = {}
+    results = prompter.generate_batch([float("nan"), "Book:\nok"], rendered=True, error_callback=errors.__setitem__)
+    assert results == ["", "ok"]
+    assert list(errors) == [0]
+    # Identical prompts are grouped once rendered at temperature 0: a row missing a variable only fails itself
+    prompter = make_prompter(server, temperature=0)
+    prompter.load_prompt_template(TWO_VARIABLES_TEMPLATE)
+    errors = {}
+    results = prompter.generate_batch([{"title": "A", "author": "X"}, {"title": "B"}], error_callback=errors.__setitem__)
+    assert results[0].strip() == "Book:\nA by X"
+    assert results[1] == ""
+    assert "author" in errors[1] and list(errors) == [1]
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from hedging import HEDGE_BURST, HedgePolicy, _race
+from prompter import Prompter
+
+def respond(content, after):
+    async def request():
+        await asyncio.sleep(after)
+        return content
+    return request
+
+def fail(after):
+    async def request():
+        await asyncio.sleep(after)
+        raise RuntimeError("failed")
+    return request
+
+def test_budget_accounting():
+    policy = HedgePolicy(budget=0.5)
+    # One hedge in reserve to start with
+    assert policy.take()
+    assert not policy.take()
+    policy.on_request()
+    assert not policy.take()
+    policy.on_request()
+    assert policy.take()
+    for _ in range(100):
+        policy.on_request()
+    assert policy.credits == HEDGE_BURST
+
+def test_fast_primary_is_not_hedged():
+    policy = HedgePolicy()
+    result = asyncio.run(_race(policy, 0.1, respond("primary", 0), respond("hedge", 0)))
+    assert result == ("primary", None)
+    assert policy.credits == 1.0
+
+def test_slow_primary_is_hedged():
+    policy = HedgePolicy()
+    result = asyncio.run(_race(policy, 0.05, respond("primary", 1.0), respond("hedge", 0)))
+    assert result == ("hedge", "won")
+    assert policy.credits == 0
+
+def test_hedge_slower_than_primary_loses():
+    policy = HedgePolicy()
+    result = asyncio.run(_race(policy, 0.05, respond("primary", 0.1), respond("hedge", 0.1)))
+    assert result == ("primary", "lost")
+
+def test_exhausted_budget_waits_for_the_primary():
+    policy = HedgePolicy()
+    policy.take()
+    result = asyncio.run(_race(policy, 0.05, respond("primary", 0.2), respond("hedge", 0)))
+    assert result == ("primary", None)
+
+def test_failed_primary_falls_back_on_the_hedge():
+    policy = HedgePolicy()
+    result = asyncio.run(_race(policy, 0.05, fail(0.1), respond("hedge", 0.2)))
+    assert result == ("hedge", "won")
+    with pytest.raises(RuntimeError):
+        asyncio.run(_race(HedgePolicy(), 0.05, fail(0.1), fail(0.1)))
+
+def test_budget_share_scales_the_alternate():
+    alternate = Prompter(base_url="http://alternate/v1/chat/completions")
+    alternate._set_rate_limits({"requests_per_minute": 100})
+    prompter = Prompter(base_url="http://primary/v1/chat/completions")
+    prompter._set_rate_limits({"requests_per_minute": 1000})
+    prompter._set_hedging(HedgePolicy(alternate=alternate))
+    share = prompter._budget_share(0.25)
+    assert share.rate_limits["requests_per_minute"] == 250
+    assert share.hedging.alternate.rate_limits["requests_per_minute"] == 25
+    assert share.hedging is not prompter.hedging
+    assert prompter.hedging.alternate.rate_limits["requests_per_minute"] == 100
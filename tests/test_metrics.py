@@ -0,0 +1,32 @@
+import urllib.request
+
+import metrics
+from metrics import LATENCY_BUCKETS, prometheus_text, record_request
+
+def histogram_lines(text, model):
+    return [line for line in text.splitlines() if line.startswith("llm_request_latency_seconds_bucket") and f'model="{model}"' in line]
+
+def test_histogram_exports_every_bucket_in_order():
+    record_request("http://mock/v1", "histogram-a", status=200, latency=3.0)
+    record_request("http://mock/v1", "histogram-b", status=200, latency=0.05)
+    record_request("http://mock/v1", "histogram-a", status=200, latency=0.2)
+    lines = histogram_lines(prometheus_text(), "histogram-a")
+    bounds = [line.split('le="')[1].split('"')[0] for line in lines]
+    assert bounds == [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+    counts = [float(line.rsplit(" ", 1)[1]) for line in lines]
+    assert counts == sorted(counts)
+    assert counts[0] == 0 and counts[1] == 1 and counts[-1] == 2
+
+def test_label_values_are_escaped():
+    record_request("http://mock/v1", 'quote"back\\slash\nline', status=200, latency=0.1)
+    assert 'model="quote\\"back\\\\slash\\nline"' in prometheus_text()
+
+def test_metrics_server_is_local_by_default(monkeypatch):
+    monkeypatch.setattr(metrics, "_SERVER", None)
+    server = metrics.start_metrics_server(port=0)
+    try:
+        assert server.server_address[0] == "127.0.0.1"
+        port = server.server_address[1]
+        assert "# TYPE" in urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+    finally:
+        server.shutdown()
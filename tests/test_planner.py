@@ -0,0 +1,26 @@
+import planner
+from prompter import Prompter, HF_URL
+from pool import PrompterPool
+
+def test_plan_passes_the_huggingface_token(monkeypatch):
+    tokens = []
+    def get_tokenizer(model_name, token=None):
+        tokens.append(token)
+        return None
+    monkeypatch.setattr(planner, "get_tokenizer", get_tokenizer)
+    monkeypatch.delenv("HF_API_TOKEN", raising=False)
+    prompter = Prompter(base_url=HF_URL)
+    prompter._set_token("hf-token")
+    prompter._set_model("google/gemma-2-9b-it")
+    plan = prompter.plan_batch(["some prompt"], rendered=True)
+    assert tokens == ["hf-token"]
+    assert plan["token_count"] == "estimate"
+
+def test_hub_token_of_pools_and_other_providers():
+    other = Prompter(base_url="https://openrouter.ai/api/v1/chat/completions")
+    other._set_token("or-token")
+    assert other._hub_token() is None
+    pool = PrompterPool(model_name="google/gemma-2-9b-it")
+    pool.add_endpoint("https://openrouter.ai/api/v1/chat/completions", "or-token")
+    pool.add_endpoint(HF_URL, "hf-token")
+    assert pool._hub_token() == "hf-token"
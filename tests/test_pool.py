@@ -0,0 +1,27 @@
+import os
+
+from pool import PrompterPool
+
+TEMPLATES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+def make_pool(layout):
+    pool = PrompterPool(model_name="mock/model")
+    pool.add_endpoint("http://127.0.0.1:9/a", "token", cache_control=True)
+    pool.add_endpoint("http://127.0.0.1:9/b", "token", cache_control=False)
+    with open(os.path.join(TEMPLATES_FOLDER, "newspaper_en.yaml")) as file:
+        pool.load_prompt_template(file.read())
+    pool._set_prompt_layout(layout)
+    return pool
+
+def test_cache_control_follows_each_endpoint():
+    pool = make_pool("system")
+    prompt_dicts = pool.make_messages("Some article")
+    hinted, plain = [pool._endpoint_messages(e, prompt_dicts) for e in pool.endpoints]
+    assert hinted[0]["content"] == [{"type": "text", "text": pool.static_prefix.strip(), "cache_control": {"type": "ephemeral"}}]
+    assert hinted[1] == prompt_dicts[1]
+    assert plain == prompt_dicts
+
+def test_no_cache_control_with_single_layout():
+    pool = make_pool("single")
+    prompt_dicts = pool.make_messages("Some article")
+    assert pool._endpoint_messages(pool.endpoints[0], prompt_dicts) == prompt_dicts
@@ -0,0 +1,47 @@
+import response_cache
+from response_cache import ResponseCache
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    now = 1000.0
+    monkeypatch.setattr(response_cache.time, "time", lambda: now)
+    cache.set("key", "value")
+    now += 30
+    assert cache.get("key") == "value"
+    now += 60
+    assert cache.get("key") is None
+    assert cache.total_size == 0
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size_mb=250 / (1024 * 1024))
+    clock = iter(range(1000))
+    monkeypatch.setattr(response_cache.time, "time", lambda: next(clock))
+    cache.set("a", "x" * 100)
+    cache.set("b", "x" * 100)
+    assert cache.get("a") is not None
+    # Only two entries fit: b is the least recently used
+    cache.set("c", "x" * 100)
+    assert cache.total_size == 200
+    assert [key for key in "abc" if cache.get(key) is not None] == ["a", "c"]
+
+def test_replacing_an_entry_updates_the_total_size(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path)
+    cache.set("key", "x" * 100)
+    cache.set("key", "x" * 10)
+    assert cache.total_size == 10
+    assert ResponseCache(path).total_size == 10
+    cache.clear()
+    assert cache.total_size == 0
+
+def test_sampled_requests_bypass_the_cache(mock_server, make_prompter, tmp_path):
+    server = mock_server()
+    prompter = make_prompter(server, temperature=1.0)
+    prompter._set_cache(ResponseCache(str(tmp_path / "cache.sqlite")))
+    prompter.generate_batch(["same", "same"])
+    assert server.stats["requests"] == 2
+    assert prompter.cache.total_size == 0
+    prompter._set_cache(prompter.cache, force=True)
+    prompter.generate_batch(["same"])
+    prompter.generate_batch(["same"])
+    assert server.stats["requests"] == 3
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import pandas as pd
+
+import run_batch
+from journal import CompletionJournal
+
+def write_services(tmp_path, urls):
+    services = {
+        f"API:MOCK{i}": {
+            "name": f"Mock {i}",
+            "base_url": url,
+            "available_models": ["mock/model" + (":free" if i else "")],
+            "cache_control": bool(i),
+            "rate_limits": None,
+        }
+        for i, url in enumerate(urls)
+    }
+    path = tmp_path / "services.json"
+    path.write_text(json.dumps(services))
+    return str(path)
+
+def test_pool_dry_run(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(run_batch, "SERVICES_PATH", write_services(tmp_path, ["http://127.0.0.1:9/v1/chat/completions"]))
+    monkeypatch.setenv("MOCK0_API_TOKEN", "token")
+    input_path = tmp_path / "input.csv"
+    pd.DataFrame({"text": ["a", "b", "c"]}).to_csv(input_path, index=False)
+    run_batch.main([str(input_path), "--text-column", "text", "-m", "mock/model", "--pool", "--dry-run"])
+    plan = json.loads(capsys.readouterr().out)
+    assert plan["requests"] == 3
+
+def test_pool_run(mock_server, tmp_path, monkeypatch):
+    servers = [mock_server(), mock_server()]
+    monkeypatch.setattr(run_batch, "SERVICES_PATH", write_services(tmp_path, [s.url for s in servers]))
+    monkeypatch.setattr(run_batch, "get_journal", lambda job_id: CompletionJournal(str(tmp_path / "journal.jsonl")))
+    monkeypatch.setenv("MOCK0_API_TOKEN", "token")
+    monkeypatch.setenv("MOCK1_API_TOKEN", "token")
+    input_path = tmp_path / "input.csv"
+    output_path = tmp_path / "output.csv"
+    pd.DataFrame({"text": [f"row {i}" for i in range(20)]}).to_csv(input_path, index=False)
+    run_batch.main([
+        str(input_path), "--text-column", "text", "-m", "mock/model", "--pool",
+        "--output", str(output_path), "--temperature", "1.0",
+    ])
+    output = pd.read_csv(output_path)
+    assert list(output["mock/model_completion"]) == list(output["text"])
+    assert sum(s.stats["requests"] for s in servers) == 20
+
+@pytest.mark.parametrize("option", [["--pool"], ["--hedge", "95"], ["--processes", "2"]])
+def test_batch_backend_rejects_live_options(option, tmp_path):
+    input_path = tmp_path / "input.csv"
+    pd.DataFrame({"text": ["a"]}).to_csv(input_path, index=False)
+    with pytest.raises(SystemExit, match="only applies to the chat backend"):
+        run_batch.main([str(input_path), "--text-column", "text", "-m", "mock/model", "--backend", "batch", *option])
+
+def test_hedge_alternate_gets_the_job_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_batch, "SERVICES_PATH", write_services(tmp_path, ["http://127.0.0.1:9/v1/chat/completions"] * 2))
+    monkeypatch.setattr(run_batch, "get_response_cache", lambda: cache)
+    monkeypatch.setenv("MOCK0_API_TOKEN", "token")
+    monkeypatch.setenv("MOCK1_API_TOKEN", "token")
+    cache = object()
+    alternates = []
+    make_alternate = run_batch.make_alternate
+    monkeypatch.setattr(run_batch, "make_alternate", lambda *args: alternates.append(make_alternate(*args)) or alternates[-1])
+    input_path = tmp_path / "input.csv"
+    pd.DataFrame({"text": ["a"]}).to_csv(input_path, index=False)
+    run_batch.main([
+        str(input_path), "--text-column", "text", "-m", "mock/model", "--service", "API:MOCK0", "--dry-run",
+        "--hedge", "95", "--hedge-service", "API:MOCK1", "--read-timeout", "7", "--cache",
+    ])
+    alternate, = alternates
+    assert alternate.model_name == "mock/model:free"
+    assert alternate.read_timeout == 7
+    assert alternate.cache is cache
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from journal import CompletionJournal
+from sharding import sharded_complete_csv
+
+def test_sharded_complete_csv_journals_completions_as_they_arrive(mock_server, make_prompter, tmp_path):
+    server = mock_server(latency_median=0.05)
+    prompter = make_prompter(server, temperature=1.0)
+    journal = CompletionJournal(str(tmp_path / "journal.jsonl"))
+    input_path = tmp_path / "input.csv"
+    output_path = tmp_path / "output.csv"
+    pd.DataFrame({"text": [f"row {i}" for i in range(40)]}).to_csv(input_path, index=False)
+    journaled_before_merge = []
+    written_at_first_result = []
+    def on_result(row, model_name, completion):
+        if not written_at_first_result:
+            written_at_first_result.append(output_path.stat().st_size)
+    rows = sharded_complete_csv(
+        [prompter], input_path, output_path, "text", ["completion"],
+        processes=2,
+        chunksize=20,
+        journal=journal,
+        result_callback=on_result,
+        # Called as each shard is written: its completions must already be journaled
+        progress_callback=lambda rows_done: journaled_before_merge.append(len(journal.completed(prompter.model_name))),
+        batch_size=2,
+        adaptive=False,
+    )
+    assert rows == 40
+    # Completions come back before their shard is done
+    assert written_at_first_result == [0]
+    assert journaled_before_merge[0] >= 20
+    assert journal.completed(prompter.model_name) == {i: f"row {i}" for i in range(40)}
+    assert list(pd.read_csv(output_path)["completion"]) == [f"row {i}" for i in range(40)]
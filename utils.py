@@ -1,12 +1,82 @@
 import os
 import json
 import yaml
+import hashlib
+import string
+import threading
 
 def read_json(path:str):
     with open(path, 'r') as file:
         data = json.load(file)
     return data
 
+# ==============================================
+# Template registry
+#
+# Templates are parsed once per process: files are revalidated through their mtime/size
+# (then content hash), and YAML contents (e.g. uploaded templates) are cached by hash.
+
+_TEMPLATES_LOCK = threading.Lock()
+_TEMPLATES_BY_CONTENT = {}  # sha256 of the YAML content -> template entry
+_TEMPLATES_BY_PATH = {}  # path -> ((mtime_ns, size), template entry)
+
+def compile_template(template:dict):
+    """
+    Joins the prefix, core prompt and suffix of a parsed template into a single format string.
+    """
+    return "\n".join([
+        template["prefix"],
+        template["core_prompt"],
+        template["suffix"]
+    ])
+
+def parse_template_content(content:str|bytes):
+    """
+    Parses a YAML prompt template, caching the result by content hash.
+
+    Returns:
+        dict: The template entry with keys `name`, `description`, `input_variables`,
+        `prompt_template` (compiled format string), `static_prefix` (rendered text before the
+        first variable, identical for every row), `data` (parsed YAML) and `content`.
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    key = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    with _TEMPLATES_LOCK:
+        entry = _TEMPLATES_BY_CONTENT.get(key)
+    if entry is None:
+        data = yaml.safe_load(content)
+        prompt_template = compile_template(data)
+        entry = {
+            "name": data.get('name', 'Unnamed Template'),
+            "description": data.get('description', 'No description available'),
+            "input_variables": data.get('input_variables', ["text"]),
+            "prompt_template": prompt_template,
+            "static_prefix": next(string.Formatter().parse(prompt_template), ("", None))[0],
+            "data": data,
+            "content": content,
+        }
+        with _TEMPLATES_LOCK:
+            _TEMPLATES_BY_CONTENT[key] = entry
+    return entry
+
+def get_template(path:str):
+    """
+    Returns the template entry of a YAML file, re-parsed only when the file changed.
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _TEMPLATES_LOCK:
+        cached = _TEMPLATES_BY_PATH.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, 'r') as file:
+        # Unchanged content (e.g. touched file) is served from the content cache
+        entry = parse_template_content(file.read())
+    with _TEMPLATES_LOCK:
+        _TEMPLATES_BY_PATH[path] = (stamp, entry)
+    return entry
+
 def get_available_templates(templates_folder:str):
     # Initialize template options list
     template_options = []
@@ -14,11 +84,10 @@ def get_available_templates(templates_folder:str):
 
     # Fetch YAML files in the templates folder and extract name and description
     if os.path.exists(templates_folder):
-        for filename in os.listdir(templates_folder):
+        for filename in sorted(os.listdir(templates_folder)):
             if filename.endswith(".yaml"):
-                with open(os.path.join(templates_folder, filename), 'r') as file:
-                    template = yaml.safe_load(file)
-                    template_options.append(filename)
-                    template_descriptions[filename] = template.get('description', 'No description available')
+                template = get_template(os.path.join(templates_folder, filename))
+                template_options.append(filename)
+                template_descriptions[filename] = template['description']
 
     return template_options, template_descriptions